@@ -0,0 +1,67 @@
+"""add rev keyframes
+
+Revision ID: 26eb50355dd4
+Revises: None
+Create Date: 2026-10-18 09:12:04.118213
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '26eb50355dd4'
+down_revision = None
+
+from alembic import op
+import sqlalchemy as sa
+from hypertextual.config import KEYFRAME_INTERVAL, KEYFRAME_PATCH_SIZE
+from hypertextual.diff_match_patch import diff_match_patch
+
+rev = sa.sql.table('rev',
+    sa.sql.column('id', sa.Integer),
+    sa.sql.column('page_id', sa.Integer),
+    sa.sql.column('rev_num', sa.Integer),
+    sa.sql.column('patch_text', sa.Text),
+    sa.sql.column('raw_text', sa.Text),
+)
+
+def upgrade():
+    op.add_column('rev', sa.Column('raw_text', sa.Text(), nullable=True))
+    backfill_keyframes()
+
+def downgrade():
+    op.drop_column('rev', 'raw_text')
+
+def backfill_keyframes():
+    # replay each page's patch chain once, storing the full raw text
+    # on every rev that qualifies as a keyframe
+    conn = op.get_bind()
+    dmp = diff_match_patch()
+    page_ids = conn.execute(
+        sa.select([rev.c.page_id]).distinct()
+    ).fetchall()
+    for (page_id,) in page_ids:
+        rows = conn.execute(
+            sa.select([rev.c.id, rev.c.rev_num, rev.c.patch_text]).
+                where(rev.c.page_id==page_id).
+                order_by(rev.c.rev_num)
+        ).fetchall()
+        raw_text = ''
+        patch_size = 0
+        for rev_id, rev_num, patch_text in rows:
+            patches = dmp.patch_fromText(patch_text or '')
+            raw_text = dmp.patch_apply(patches, raw_text)[0]
+            patch_size += len(patch_text or '')
+            if is_keyframe(rev_num, patch_size):
+                conn.execute(
+                    rev.update().
+                        where(rev.c.id==rev_id).
+                        values(raw_text=raw_text)
+                )
+                patch_size = 0
+
+def is_keyframe(rev_num, patch_size):
+    # mirrors Revision.__is_keyframe
+    if rev_num == 0:
+        return False
+    if KEYFRAME_INTERVAL and rev_num % KEYFRAME_INTERVAL == 0:
+        return True
+    return patch_size >= KEYFRAME_PATCH_SIZE
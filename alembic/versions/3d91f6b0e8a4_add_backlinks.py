@@ -0,0 +1,40 @@
+"""add backlinks
+
+Revision ID: 3d91f6b0e8a4
+Revises: b7d24e90a1c5
+Create Date: 2026-10-18 14:21:37.604192
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3d91f6b0e8a4'
+down_revision = 'b7d24e90a1c5'
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.add_column('page', sa.Column('render_gen', sa.Integer(), nullable=False, server_default='0'))
+    op.create_table('backlink',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('src_page_id', sa.Integer(), nullable=False),
+        sa.Column('tgt_page_uid', sa.String(length=64), nullable=False),
+        sa.Column('tgt_page_title', sa.String(length=1024), nullable=False),
+        sa.ForeignKeyConstraint(['src_page_id'], ['page.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_backlink_src_page_id', 'backlink', ['src_page_id'])
+    op.create_index('ix_backlink_tgt_page_uid_tgt_page_title', 'backlink', ['tgt_page_uid', 'tgt_page_title'])
+    # index the links of each page's current published rev
+    op.execute(
+        'INSERT INTO backlink (src_page_id, tgt_page_uid, tgt_page_title) '
+        'SELECT DISTINCT page.id, COALESCE(link.tgt_page_uid, acct.uid), link.tgt_page_title '
+        'FROM page '
+        'JOIN acct ON acct.id = page.acct_id '
+        'JOIN rev ON rev.page_id = page.id AND rev.rev_num = page.curr_rev_num '
+        'JOIN link ON link.rev_id = rev.id'
+    )
+
+def downgrade():
+    op.drop_table('backlink')
+    op.drop_column('page', 'render_gen')
@@ -0,0 +1,22 @@
+"""add page rev storage
+
+Revision ID: 4f0a7c2d9b31
+Revises: 26eb50355dd4
+Create Date: 2026-10-18 10:02:47.530981
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4f0a7c2d9b31'
+down_revision = '26eb50355dd4'
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    # existing pages keep their forward patch chains; convert them in bulk
+    # with `python hypertextual/convert_revs.py reverse`
+    op.add_column('page', sa.Column('rev_storage', sa.String(length=16), nullable=False, server_default='forward'))
+
+def downgrade():
+    op.drop_column('page', 'rev_storage')
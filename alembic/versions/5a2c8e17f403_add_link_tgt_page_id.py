@@ -0,0 +1,39 @@
+"""add link tgt_page_id
+
+Revision ID: 5a2c8e17f403
+Revises: 3d91f6b0e8a4
+Create Date: 2026-10-18 15:08:52.271640
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5a2c8e17f403'
+down_revision = '3d91f6b0e8a4'
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.add_column('link', sa.Column('tgt_page_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('link_tgt_page_id_fkey', 'link', 'page', ['tgt_page_id'], ['id'], ondelete='SET NULL')
+    op.create_index('ix_link_tgt_page_id', 'link', ['tgt_page_id'])
+    # resolve every existing link to its target page; a link without a uid
+    # targets a page in the account of the page it appears on
+    op.execute(
+        'UPDATE link SET tgt_page_id = ('
+            'SELECT MIN(page.id) FROM page '
+            'JOIN acct ON acct.id = page.acct_id '
+            'WHERE page.title = link.tgt_page_title '
+            'AND acct.uid = COALESCE(link.tgt_page_uid, ('
+                'SELECT src_acct.uid FROM rev '
+                'JOIN page AS src_page ON src_page.id = rev.page_id '
+                'JOIN acct AS src_acct ON src_acct.id = src_page.acct_id '
+                'WHERE rev.id = link.rev_id'
+            '))'
+        ')'
+    )
+
+def downgrade():
+    op.drop_index('ix_link_tgt_page_id', 'link')
+    op.drop_constraint('link_tgt_page_id_fkey', 'link')
+    op.drop_column('link', 'tgt_page_id')
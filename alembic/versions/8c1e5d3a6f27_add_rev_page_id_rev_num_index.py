@@ -0,0 +1,20 @@
+"""add rev page_id rev_num index
+
+Revision ID: 8c1e5d3a6f27
+Revises: 4f0a7c2d9b31
+Create Date: 2026-10-18 11:26:15.084411
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8c1e5d3a6f27'
+down_revision = '4f0a7c2d9b31'
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_index('ix_rev_page_id_rev_num', 'rev', ['page_id', 'rev_num'], unique=True)
+
+def downgrade():
+    op.drop_index('ix_rev_page_id_rev_num', 'rev')
@@ -0,0 +1,53 @@
+"""add page redirect_page_id
+
+Revision ID: 9e4b7a3c5d12
+Revises: 5a2c8e17f403
+Create Date: 2026-10-18 16:40:13.885027
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9e4b7a3c5d12'
+down_revision = '5a2c8e17f403'
+
+from alembic import op
+import sqlalchemy as sa
+
+# redirect chains longer than this are left partly collapsed
+MAX_CHAIN_LENGTH = 10
+
+def upgrade():
+    op.add_column('page', sa.Column('redirect_page_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('page_redirect_page_id_fkey', 'page', 'page', ['redirect_page_id'], ['id'], ondelete='SET NULL')
+    # a redirect page's current rev holds a single link, to its target
+    op.execute(
+        'UPDATE page SET redirect_page_id = ('
+            'SELECT link.tgt_page_id FROM rev '
+            'JOIN link ON link.rev_id = rev.id '
+            'WHERE rev.page_id = page.id '
+            'AND rev.rev_num = page.curr_rev_num '
+            'AND link.link_num = 0'
+        ') '
+        'WHERE page.redirect'
+    )
+    collapse_redirect_chains()
+
+def downgrade():
+    op.drop_constraint('page_redirect_page_id_fkey', 'page')
+    op.drop_column('page', 'redirect_page_id')
+
+def collapse_redirect_chains():
+    # point redirects to redirect pages at their targets, one hop at a time
+    conn = op.get_bind()
+    for i in range(MAX_CHAIN_LENGTH):
+        result = conn.execute(
+            'UPDATE page SET redirect_page_id = ('
+                'SELECT tgt_page.redirect_page_id FROM page AS tgt_page '
+                'WHERE tgt_page.id = page.redirect_page_id'
+            ') '
+            'WHERE redirect_page_id IN ('
+                'SELECT id FROM page WHERE redirect_page_id IS NOT NULL'
+            ')'
+        )
+        if not result.rowcount:
+            break
@@ -0,0 +1,28 @@
+"""add page and link lookup indexes
+
+Revision ID: b7d24e90a1c5
+Revises: 8c1e5d3a6f27
+Create Date: 2026-10-18 12:04:51.662730
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b7d24e90a1c5'
+down_revision = '8c1e5d3a6f27'
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    # page lookups by slug or title always filter on the owning account
+    op.create_index('ix_page_acct_id_slug', 'page', ['acct_id', 'slug'])
+    op.create_index('ix_page_acct_id_title', 'page', ['acct_id', 'title'])
+    # links are fetched per rev, and searched by target page
+    op.create_index('ix_link_rev_id', 'link', ['rev_id'])
+    op.create_index('ix_link_tgt_page_uid_tgt_page_title', 'link', ['tgt_page_uid', 'tgt_page_title'])
+
+def downgrade():
+    op.drop_index('ix_link_tgt_page_uid_tgt_page_title', 'link')
+    op.drop_index('ix_link_rev_id', 'link')
+    op.drop_index('ix_page_acct_id_title', 'page')
+    op.drop_index('ix_page_acct_id_slug', 'page')
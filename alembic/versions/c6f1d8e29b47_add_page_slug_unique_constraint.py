@@ -0,0 +1,31 @@
+"""add page slug unique constraint
+
+Revision ID: c6f1d8e29b47
+Revises: 9e4b7a3c5d12
+Create Date: 2026-10-18 17:26:40.319558
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c6f1d8e29b47'
+down_revision = '9e4b7a3c5d12'
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    # give any pages that lost a race for a slug a distinct one, keeping
+    # the slug on the oldest page
+    op.execute(
+        "UPDATE page SET slug = slug || '-' || CAST(id AS VARCHAR) "
+        "WHERE id NOT IN ("
+            "SELECT MIN(id) FROM page GROUP BY acct_id, slug"
+        ")"
+    )
+    # the constraint's index replaces the plain one
+    op.drop_index('ix_page_acct_id_slug', 'page')
+    op.create_unique_constraint('uq_page_acct_id_slug', 'page', ['acct_id', 'slug'])
+
+def downgrade():
+    op.drop_constraint('uq_page_acct_id_slug', 'page')
+    op.create_index('ix_page_acct_id_slug', 'page', ['acct_id', 'slug'])
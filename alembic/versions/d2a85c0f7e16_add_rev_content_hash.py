@@ -0,0 +1,22 @@
+"""add rev content hash
+
+Revision ID: d2a85c0f7e16
+Revises: c6f1d8e29b47
+Create Date: 2026-10-18 18:12:09.547310
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd2a85c0f7e16'
+down_revision = 'c6f1d8e29b47'
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    # existing revs are left without a hash, and skip the integrity check;
+    # a draft gets one the next time it is saved
+    op.add_column('rev', sa.Column('content_hash', sa.String(length=40), nullable=True))
+
+def downgrade():
+    op.drop_column('rev', 'content_hash')
@@ -0,0 +1,34 @@
+"""add rev patch format
+
+Revision ID: e41b9c6a0d38
+Revises: d2a85c0f7e16
+Create Date: 2026-10-18 19:03:41.826094
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e41b9c6a0d38'
+down_revision = 'd2a85c0f7e16'
+
+from alembic import op
+import sqlalchemy as sa
+
+rev = sa.sql.table('rev',
+    sa.sql.column('patch_text', sa.Text),
+    sa.sql.column('patch_format', sa.String),
+)
+
+def upgrade():
+    # existing patches are all diff_match_patch patch text; convert them
+    # with `convert_revs.py --patch-format delta`
+    op.add_column('rev', sa.Column('patch_format', sa.String(length=16), nullable=True))
+    op.execute(
+        rev.update().
+            where(rev.c.patch_text!=None).
+            values(patch_format='text')
+    )
+
+def downgrade():
+    # patches in other formats must first be converted back with
+    # `convert_revs.py --patch-format text`
+    op.drop_column('rev', 'patch_format')
@@ -0,0 +1,42 @@
+# compare diff_match_patch's match_bitap with match_bitapMasks on patch
+# contexts that have drifted from their expected location in a large text;
+# run with `python benchmarks/bench_bitap.py`
+
+import os, sys, random, timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'hypertextual'))
+from diff_match_patch.diff_match_patch import diff_match_patch
+
+def get_inputs(text_size, num_patterns):
+    # 32-character patterns (Match_MaxBits) taken from the text, each with a
+    # few characters changed, searched for some distance from where they are
+    rand = random.Random(0)
+    words = ['book', 'record', 'page', 'link', 'list', 'the', 'a', 'of', 'and']
+    text = ' '.join(rand.choice(words) for i in range(text_size // 4))
+    inputs = []
+    for i in range(num_patterns):
+        start = rand.randrange(len(text) - 32)
+        pattern = list(text[start:start+32])
+        for j in range(3):
+            pattern[rand.randrange(32)] = rand.choice('xyz')
+        inputs.append((''.join(pattern), max(0, start + rand.randrange(-200, 200))))
+    return text, inputs
+
+def bench(func, text, inputs, number=3):
+    return min(timeit.repeat(
+        lambda: [func(text, pattern, loc) for pattern, loc in inputs],
+        number=1, repeat=number
+    ))
+
+def main():
+    dmp = diff_match_patch()
+    print '%10s %10s %12s %12s' % ('text size', 'patterns', 'loop (s)', 'masks (s)')
+    for text_size in [10000, 100000]:
+        text, inputs = get_inputs(text_size, 100)
+        for pattern, loc in inputs:
+            assert dmp.match_bitap(text, pattern, loc) == dmp.match_bitapMasks(text, pattern, loc)
+        loop_time = bench(dmp.match_bitap, text, inputs)
+        masks_time = bench(dmp.match_bitapMasks, text, inputs)
+        print '%10s %10s %12.4f %12.4f' % (len(text), len(inputs), loop_time, masks_time)
+
+if __name__ == '__main__':
+    main()
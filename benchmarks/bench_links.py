@@ -0,0 +1,29 @@
+# compare link extraction with HT_LINK_RE against the split_links tokenizer
+# on pathological single-line inputs; run with `python benchmarks/bench_links.py`
+
+import os, re, sys, timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'hypertextual'))
+from models.md import HT_LINK_RE, split_links
+
+def get_inputs(n):
+    return [
+        ('unclosed brackets', '[[a ' * n),
+        ('separators after links', '[[a]] ' * n + '::'),
+        ('pasted log line', ' '.join('[[%s] x::y' % i for i in range(n))),
+        ('adjacent links', '[[a]]' * n),
+    ]
+
+def bench(func, text, number=3):
+    return min(timeit.repeat(lambda: func(text), number=1, repeat=number))
+
+def main():
+    regex = re.compile(HT_LINK_RE)
+    print '%-24s %8s %12s %12s' % ('input', 'size', 'regex (s)', 'tokens (s)')
+    for n in [1000, 2000, 4000]:
+        for name, text in get_inputs(n):
+            regex_time = bench(lambda t: regex.sub('', t), text)
+            token_time = bench(split_links, text)
+            print '%-24s %8s %12.4f %12.4f' % (name, len(text), regex_time, token_time)
+
+if __name__ == '__main__':
+    main()
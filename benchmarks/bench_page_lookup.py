@@ -0,0 +1,106 @@
+# time the hot page and link lookups against a database of 100k pages,
+# with and without the lookup indexes (and the unique (acct_id, slug)
+# constraint, where the database can drop it); run with
+# `python benchmarks/bench_page_lookup.py [conn_str] [num_pages]`
+# (defaults to CONN_STR_TEST, whose tables are dropped and recreated)
+
+import os, random, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'hypertextual'))
+from sqlalchemy import create_engine, UniqueConstraint
+from sqlalchemy.schema import AddConstraint, DropConstraint
+from config import CONN_STR_TEST
+from models import db_session, Base, Account, Page, Link
+
+INDEXES = [
+    Page.__table__.indexes,
+    Link.__table__.indexes,
+]
+
+# the slug lookups are served by the index behind this constraint
+UNIQUE_CONSTRAINTS = [
+    c for c in Page.__table__.constraints if isinstance(c, UniqueConstraint)
+]
+
+def main():
+    conn_str = sys.argv[1] if len(sys.argv) > 1 else CONN_STR_TEST
+    num_pages = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    engine = create_engine(conn_str)
+    db_session.configure(bind=engine)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    populate(engine, num_pages)
+    if not engine.dialect.supports_alter:
+        # e.g. sqlite, which can't drop a constraint from an existing table
+        print 'slug lookups stay indexed by the unique (acct_id, slug) constraint'
+    print '%-24s %14s %14s' % ('lookup', 'no index (ms)', 'indexed (ms)')
+    drop_indexes(engine)
+    without = run_lookups(num_pages)
+    create_indexes(engine)
+    indexed = run_lookups(num_pages)
+    for name in sorted(without):
+        print '%-24s %14.3f %14.3f' % (name, without[name], indexed[name])
+    db_session.remove()
+    Base.metadata.drop_all(engine)
+
+def populate(engine, num_pages):
+    # spread the pages over 100 accounts, with a link per page
+    num_accts = 100
+    conn = engine.connect()
+    conn.execute(Account.__table__.insert(), [
+        {'id': i, 'uid': 'user%s' % i, 'email': 'user%s@example.com' % i, 'pw_hash': 'x'}
+        for i in range(num_accts)
+    ])
+    conn.execute(Page.__table__.insert(), [
+        {'id': i, 'acct_id': i % num_accts, 'title': 'Page %s' % i, 'slug': 'page-%s' % i,
+         'curr_rev_num': 0, 'private': False, 'redirect': False, 'rev_storage': 'forward'}
+        for i in range(num_pages)
+    ])
+    conn.execute(Base.metadata.tables['rev'].insert(), [
+        {'id': i, 'page_id': i, 'rev_num': 0, 'patch_text': '', 'use_markdown': True}
+        for i in range(num_pages)
+    ])
+    conn.execute(Link.__table__.insert(), [
+        {'rev_id': i, 'link_num': 0, 'tgt_page_title': 'Page %s' % random.randrange(num_pages)}
+        for i in range(num_pages)
+    ])
+    conn.close()
+
+def drop_indexes(engine):
+    for indexes in INDEXES:
+        for index in indexes:
+            index.drop(engine)
+    if engine.dialect.supports_alter:
+        for constraint in UNIQUE_CONSTRAINTS:
+            engine.execute(DropConstraint(constraint))
+
+def create_indexes(engine):
+    for indexes in INDEXES:
+        for index in indexes:
+            index.create(engine)
+    if engine.dialect.supports_alter:
+        for constraint in UNIQUE_CONSTRAINTS:
+            engine.execute(AddConstraint(constraint))
+
+def run_lookups(num_pages, repeat=200):
+    page_nums = [random.randrange(num_pages) for i in range(repeat)]
+    accts = dict((acct.id, acct) for acct in Account.get_all())
+    lookups = {
+        'get_page_by_slug': lambda i: accts[i % 100].get_page_by_slug('page-%s' % i),
+        'get_page_by_title': lambda i: accts[i % 100].get_page_by_title('Page %s' % i),
+        'slug_exists': lambda i: Page.slug_exists('user%s' % (i % 100), 'page-%s' % i),
+        'title_exists': lambda i: Page.title_exists('user%s' % (i % 100), 'Page %s' % i),
+        'links_by_rev': lambda i: Link.query.filter(Link.rev_id==i).all(),
+        'links_by_target': lambda i: Link.query.filter(
+            Link.tgt_page_uid==None, Link.tgt_page_title=='Page %s' % i).all(),
+    }
+    timings = {}
+    for name, lookup in lookups.items():
+        start = time.time()
+        for i in page_nums:
+            lookup(i)
+        timings[name] = (time.time() - start) * 1000 / repeat
+        db_session.expunge_all()
+    return timings
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# compare the stored size and replay time of a long revision history in each
+# patch format (see Revision.default_patch_format);
+# run with `python benchmarks/bench_patch_formats.py`
+
+import os, sys, zlib, base64, random, timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'hypertextual'))
+from diff_match_patch.diff_match_patch import diff_match_patch
+
+def get_history(num_revs, num_lines):
+    # a page that grows a little and has a few lines edited in each rev
+    rand = random.Random(0)
+    lines = [u'line %s of a page about books and records' % i for i in range(num_lines)]
+    texts = []
+    for rev_num in range(num_revs):
+        for i in range(3):
+            lines[rand.randrange(len(lines))] += u' (edited in rev %s)' % rev_num
+        lines.insert(rand.randrange(len(lines)), u'a line added in rev %s' % rev_num)
+        texts.append(u'\n'.join(lines))
+    return texts
+
+def make_patch(dmp, from_text, text, patch_format):
+    # mirrors Revision.__set_patch
+    if patch_format == 'text':
+        return dmp.patch_toText(dmp.patch_make(from_text, text))
+    diffs = dmp.diff_main(from_text, text)
+    dmp.diff_cleanupEfficiency(diffs)
+    delta = dmp.diff_toDelta(diffs)
+    if patch_format == 'zdelta':
+        delta = base64.b64encode(zlib.compress(delta))
+    return delta
+
+def apply_patch(dmp, patch_text, patch_format, from_text):
+    # mirrors Revision.__apply_patch
+    if patch_format == 'text':
+        return dmp.patch_apply(dmp.patch_fromText(patch_text), from_text)[0]
+    if patch_format == 'zdelta':
+        patch_text = zlib.decompress(base64.b64decode(patch_text))
+    return dmp.diff_text2(dmp.diff_fromDelta(from_text, patch_text))
+
+def replay(dmp, patches, patch_format):
+    text = u''
+    for patch_text in patches:
+        text = apply_patch(dmp, patch_text, patch_format, text)
+    return text
+
+def main():
+    dmp = diff_match_patch()
+    print '%-8s %6s %8s %12s %12s' % ('format', 'revs', 'lines', 'size (kb)', 'replay (s)')
+    for num_revs, num_lines in [(50, 200), (50, 2000)]:
+        texts = get_history(num_revs, num_lines)
+        for patch_format in ['text', 'delta', 'zdelta']:
+            patches = []
+            from_text = u''
+            for text in texts:
+                patches.append(make_patch(dmp, from_text, text, patch_format))
+                from_text = text
+            assert replay(dmp, patches, patch_format) == texts[-1]
+            size = sum(len(patch_text) for patch_text in patches) / 1024.0
+            replay_time = min(timeit.repeat(lambda: replay(dmp, patches, patch_format), number=1, repeat=3))
+            print '%-8s %6s %8s %12.1f %12.4f' % (patch_format, num_revs, num_lines, size, replay_time)
+
+if __name__ == '__main__':
+    main()
@@ -6,8 +6,69 @@ PORT = 5000 # does not apply to wsgi
 
 CONN_STR = os.environ.get('DATABASE_URL', 'postgresql://nw@localhost:5432/hypertextual')
 CONN_STR_TEST = 'postgresql://nw@localhost:5432/hypertextual_test'
+
+# optional read replicas (comma-separated urls), which serve read-only requests;
+# a user's requests go to the primary for a few seconds after they post anything
+CONN_STR_REPLICAS = [
+    conn_str for conn_str in
+    os.environ.get('HYPERTEXTUAL_DATABASE_REPLICA_URLS', '').split(',')
+    if conn_str
+]
+PRIMARY_STICKY_SECONDS = int(os.environ.get('HYPERTEXTUAL_PRIMARY_STICKY_SECONDS', 5))
 RESERVED_ACCT_NAMES = []
 
+# database connection pool, per worker process; timeout and recycle are in
+# seconds (recycle -1 never recycles), and pre-ping tests each connection
+# with a cheap query when it is checked out, replacing it if it is dead
+DB_POOL_SIZE = int(os.environ.get('HYPERTEXTUAL_DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('HYPERTEXTUAL_DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.environ.get('HYPERTEXTUAL_DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('HYPERTEXTUAL_DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('HYPERTEXTUAL_DB_POOL_PRE_PING', 'on') == 'on'
+
+# postgres statement_timeout for every connection, in milliseconds (0 = none)
+DB_STATEMENT_TIMEOUT = int(os.environ.get('HYPERTEXTUAL_DB_STATEMENT_TIMEOUT', 30000))
+
+# store the full text of a revision every n revisions, or once the patches
+# since the last full-text revision exceed this many characters
+KEYFRAME_INTERVAL = int(os.environ.get('HYPERTEXTUAL_KEYFRAME_INTERVAL', 50))
+KEYFRAME_PATCH_SIZE = int(os.environ.get('HYPERTEXTUAL_KEYFRAME_PATCH_SIZE', 65536))
+
+# revision storage for new pages: 'forward' patches from the first revision,
+# or 'reverse' patches from the current revision, which is stored in full
+REVISION_STORAGE = os.environ.get('HYPERTEXTUAL_REVISION_STORAGE', 'forward')
+
+# format of new revision patches: 'text' (diff_match_patch patch text),
+# 'delta' (a compact list of edits), or 'zdelta' (a zlib-compressed delta)
+REVISION_PATCH_FORMAT = os.environ.get('HYPERTEXTUAL_REVISION_PATCH_FORMAT', 'delta')
+
+# how revision patches are diffed: 'char' (diff_match_patch, the smallest
+# patches), 'line' (diff_match_patch by line, rediffing only the changed lines
+# by character, fast on large texts), or 'auto' (by line once the two texts
+# together reach the threshold, in characters)
+DIFF_BACKEND = os.environ.get('HYPERTEXTUAL_DIFF_BACKEND', 'auto')
+DIFF_LINE_MODE_THRESHOLD = int(os.environ.get('HYPERTEXTUAL_DIFF_LINE_MODE_THRESHOLD', 100000))
+
+# in-process cache of rendered revisions; renders of current revs are retired
+# in every process when a linked page changes, but the ttl bounds how long a
+# render of an older rev can go stale
+RENDER_CACHE_SIZE = int(os.environ.get('HYPERTEXTUAL_RENDER_CACHE_SIZE', 1000))
+RENDER_CACHE_TTL = int(os.environ.get('HYPERTEXTUAL_RENDER_CACHE_TTL', 300))
+
+# in-process cache of session accounts; the ttl bounds how long another
+# worker process can serve an account made stale by a password change
+ACCT_CACHE_SIZE = int(os.environ.get('HYPERTEXTUAL_ACCT_CACHE_SIZE', 1000))
+ACCT_CACHE_TTL = int(os.environ.get('HYPERTEXTUAL_ACCT_CACHE_TTL', 60))
+
+# in-process cache of redirect page urls; the ttl bounds how long another
+# worker process can redirect to a page after it has moved again
+REDIRECT_CACHE_SIZE = int(os.environ.get('HYPERTEXTUAL_REDIRECT_CACHE_SIZE', 1000))
+REDIRECT_CACHE_TTL = int(os.environ.get('HYPERTEXTUAL_REDIRECT_CACHE_TTL', 300))
+
+# run read-only requests (e.g., page views) in read-only transactions, so that
+# postgres rejects any write made while serving them; costs one statement
+READ_ONLY_TRANSACTIONS = os.environ.get('HYPERTEXTUAL_READ_ONLY_TRANSACTIONS', '') == 'on'
+
 # todo: do something with these
 SECRET_KEY = 'development key'
 USERNAME = 'admin'
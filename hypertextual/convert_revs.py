@@ -0,0 +1,56 @@
+import argparse
+from flask import Flask
+from sqlalchemy import create_engine, or_
+from models import db_session, configure_revisions, Page, Revision
+
+def main():
+    command_line_args = get_command_line_args()
+    app = create_flask_app()
+    configure_revisions(app.config)
+    engine = create_alchemy_engine(app)
+    db_session.configure(bind=engine)
+    convert_pages(command_line_args.rev_storage, command_line_args.patch_format)
+
+def get_command_line_args():
+    p = argparse.ArgumentParser(description='Convert the revision storage of existing pages.')
+    p.add_argument('rev_storage', nargs='?', choices=['forward', 'reverse'],
+        help='storage mode to convert to (default: keep each page\'s storage mode)')
+    p.add_argument('--patch-format', choices=['text', 'delta', 'zdelta'],
+        help='patch format to convert to (default: keep patches in their format)')
+    command_line_args = p.parse_args()
+    if command_line_args.rev_storage is None and command_line_args.patch_format is None:
+        p.error('give a storage mode, a patch format, or both')
+    return command_line_args
+
+def create_flask_app():
+    app = Flask(__name__)
+    app.config.from_object('config')
+    return app
+
+def create_alchemy_engine(app):
+    conn_str = app.config['CONN_STR']
+    engine = create_engine(conn_str)
+    return engine
+
+def convert_pages(rev_storage, patch_format=None):
+    # convert one page per transaction, so that a long run
+    # never holds locks on more than one page's revisions
+    criteria = []
+    if rev_storage is not None:
+        criteria.append(Page.rev_storage!=rev_storage)
+    if patch_format is not None:
+        criteria.append(Page.revs.any(Revision.patch_format!=patch_format))
+    page_ids = db_session.query(Page.id).\
+        filter(or_(*criteria)).\
+        order_by(Page.id).all()
+    for (page_id,) in page_ids:
+        page = Page.query.get(page_id)
+        page.set_rev_storage(rev_storage or page.rev_storage, patch_format)
+        db_session.commit()
+        db_session.expunge_all()
+    print 'converted %s pages to %s storage, %s patches' % (
+        len(page_ids), rev_storage or 'existing', patch_format or 'existing'
+    )
+
+if __name__=='__main__':
+    main()
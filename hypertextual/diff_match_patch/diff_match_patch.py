@@ -51,6 +51,10 @@ class diff_match_patch:
     self.Diff_EditCost = 4
     # At what point is no match declared (0.0 = perfection, 1.0 = very loose).
     self.Match_Threshold = 0.5
+    # Bitap implementation used by match_main: 'masks' (match_bitapMasks,
+    # which precomputes the character masks) or 'loop' (match_bitap).
+    # Both find the same matches.
+    self.Match_BitapImpl = 'masks'
     # How far to search for a match (0 = exact location, 1000+ = broad match).
     # A match this many characters away from the expected location will add
     # 1.0 to the score (0.0 is a perfect match).
@@ -254,6 +258,81 @@ class diff_match_patch:
 
     return diffs
 
+  def diff_lineHunks(self, text1, text2):
+    """Do a line-level diff on both strings, then rediff and clean up each
+      run of changed lines on its own, so that the cost follows the size of
+      the changes rather than the size of the texts.
+      This speedup can produce non-minimal diffs.
+
+    Args:
+      text1: Old string to be diffed.
+      text2: New string to be diffed.
+
+    Returns:
+      Array of changes.
+    """
+    if self.Diff_Timeout <= 0:
+      deadline = sys.maxint
+    else:
+      deadline = time.time() + self.Diff_Timeout
+
+    # Trim off the common prefix and suffix, in whole lines.
+    commonlength = self.diff_commonPrefix(text1, text2)
+    commonlength = text1.rfind("\n", 0, commonlength) + 1
+    commonprefix = text1[:commonlength]
+    text1 = text1[commonlength:]
+    text2 = text2[commonlength:]
+    commonlength = self.diff_commonSuffix(text1, text2)
+    suffixstart = len(text1) - commonlength
+    if suffixstart > 0:
+      suffixstart = text1.find("\n", suffixstart - 1) + 1 or len(text1)
+    commonsuffix = text1[suffixstart:]
+    text1 = text1[:suffixstart]
+    text2 = text2[:len(text2) - len(commonsuffix)]
+
+    # Scan the rest of the text on a line-by-line basis.
+    (chars1, chars2, linearray) = self.diff_linesToChars(text1, text2)
+    line_diffs = self.diff_main(chars1, chars2, False, deadline)
+    self.diff_charsToLines(line_diffs, linearray)
+    line_diffs.insert(0, (self.DIFF_EQUAL, commonprefix))
+
+    # Rediff each replacement block character-by-character, and build the
+    # result in a new list rather than splicing the line diffs in place.
+    diffs = []
+    def diff_append(op, data):
+      # Merge with the previous entry if it is the same operation.
+      if not data:
+        return
+      if diffs and diffs[-1][0] == op:
+        diffs[-1] = (op, diffs[-1][1] + data)
+      else:
+        diffs.append((op, data))
+
+    text_delete = []
+    text_insert = []
+    # The common suffix doubles as a dummy entry at the end.
+    for (op, data) in line_diffs + [(self.DIFF_EQUAL, commonsuffix)]:
+      if op == self.DIFF_INSERT:
+        text_insert.append(data)
+      elif op == self.DIFF_DELETE:
+        text_delete.append(data)
+      else:
+        if text_delete and text_insert:
+          hunk = self.diff_main(''.join(text_delete), ''.join(text_insert),
+                                False, deadline)
+          if len(hunk) > 2:
+            self.diff_cleanupSemantic(hunk)
+          self.diff_cleanupEfficiency(hunk)
+          for (hunk_op, hunk_data) in hunk:
+            diff_append(hunk_op, hunk_data)
+        else:
+          diff_append(self.DIFF_DELETE, ''.join(text_delete))
+          diff_append(self.DIFF_INSERT, ''.join(text_insert))
+        text_delete = []
+        text_insert = []
+        diff_append(op, data)
+    return diffs
+
   def diff_bisect(self, text1, text2, deadline):
     """Find the 'middle snake' of a diff, split the problem in two
       and return the recursively constructed diff.
@@ -1229,6 +1308,9 @@ class diff_match_patch:
     # Check for null inputs.
     if text == None or pattern == None:
       raise ValueError("Null inputs. (match_main)")
+    if self.Match_BitapImpl not in ("masks", "loop"):
+      raise ValueError("Unknown Match_BitapImpl: %r (match_main)" %
+                       self.Match_BitapImpl)
 
     loc = max(0, min(loc, len(text)))
     if text == pattern:
@@ -1242,7 +1324,10 @@ class diff_match_patch:
       return loc
     else:
       # Do a fuzzy compare.
-      match = self.match_bitap(text, pattern, loc)
+      if self.Match_BitapImpl == "masks":
+        match = self.match_bitapMasks(text, pattern, loc)
+      else:
+        match = self.match_bitap(text, pattern, loc)
       return match
 
   def match_bitap(self, text, pattern, loc):
@@ -1351,6 +1436,115 @@ class diff_match_patch:
       last_rd = rd
     return best_loc
 
+  def match_bitapMasks(self, text, pattern, loc):
+    """Locate the best instance of 'pattern' in 'text' near 'loc' using the
+    Bitap algorithm, finding the same match as match_bitap.  Looks up the
+    alphabet mask of each character once for all error levels, rather than
+    once per level, and sizes the bit arrays to the searched window, rather
+    than to the whole text before it.
+
+    Args:
+      text: The text to search.
+      pattern: The pattern to search for.
+      loc: The location to search around.
+
+    Returns:
+      Best match index or -1.
+    """
+    # Initialise the alphabet.
+    s = self.match_alphabet(pattern)
+
+    patternlen = float(len(pattern))
+    distance = self.Match_Distance
+    def match_bitapScore(e, x):
+      """Compute and return the score for a match with e errors and x location.
+      Same as in match_bitap.
+      """
+      accuracy = e / patternlen
+      proximity = abs(loc - x)
+      if not distance:
+        # Dodge divide by zero error.
+        return proximity and 1.0 or accuracy
+      return accuracy + (proximity / float(distance))
+
+    # Highest score beyond which we give up.
+    score_threshold = self.Match_Threshold
+    # Is there a nearby exact match? (speedup)
+    best_loc = text.find(pattern, loc)
+    if best_loc != -1:
+      score_threshold = min(match_bitapScore(0, best_loc), score_threshold)
+      # What about in the other direction? (speedup)
+      best_loc = text.rfind(pattern, loc + len(pattern))
+      if best_loc != -1:
+        score_threshold = min(match_bitapScore(0, best_loc), score_threshold)
+
+    # Initialise the bit arrays.
+    matchmask = 1 << (len(pattern) - 1)
+    best_loc = -1
+
+    bin_max = len(pattern) + len(text)
+    # Later passes only search within the window of the first, so the bit
+    # arrays and the character masks cover just that window, from 'base':
+    # charmasks[k] is the mask of text[base + k - 1], where positions past
+    # the end of the text match nothing, and is looked up only once.
+    charmasks = None
+    base = 0
+    last_rd = None
+    for d in xrange(len(pattern)):
+      # Scan for the best match each iteration allows for one more error.
+      # Run a binary search to determine how far from 'loc' we can stray at
+      # this error level.
+      bin_min = 0
+      bin_mid = bin_max
+      while bin_min < bin_mid:
+        if match_bitapScore(d, loc + bin_mid) <= score_threshold:
+          bin_min = bin_mid
+        else:
+          bin_max = bin_mid
+        bin_mid = (bin_max - bin_min) // 2 + bin_min
+
+      # Use the result from this iteration as the maximum for the next.
+      bin_max = bin_mid
+      start = max(1, loc - bin_mid + 1)
+      finish = min(loc + bin_mid, len(text)) + len(pattern)
+
+      if charmasks is None:
+        # (The window is empty if loc is past the end of the text.)
+        base = min(start, finish + 1)
+        get = s.get
+        charmasks = [get(char, 0) for char in text[base - 1:finish]]
+        charmasks.extend([0] * (finish - base + 1 - len(charmasks)))
+
+      rd = [0] * (finish - base + 2)
+      rd[finish - base + 1] = (1 << d) - 1
+      for k in xrange(finish - base, start - base - 1, -1):
+        if d == 0:  # First pass: exact match.
+          rd_k = ((rd[k + 1] << 1) | 1) & charmasks[k]
+        else:  # Subsequent passes: fuzzy match.
+          last_rd_k1 = last_rd[k + 1]
+          rd_k = ((((rd[k + 1] << 1) | 1) & charmasks[k]) |
+                  (((last_rd_k1 | last_rd[k]) << 1) | 1) | last_rd_k1)
+        rd[k] = rd_k
+        if rd_k & matchmask:
+          score = match_bitapScore(d, base + k - 1)
+          # This match will almost certainly be better than any existing match.
+          # But check anyway.
+          if score <= score_threshold:
+            # Told you so.
+            score_threshold = score
+            best_loc = base + k - 1
+            if best_loc > loc:
+              # When passing loc, don't exceed our current distance from loc.
+              start = max(1, 2 * loc - best_loc)
+            else:
+              # Already passed loc, downhill from here on in.
+              break
+      # No hope for a (better) match at greater error levels.
+      if match_bitapScore(d + 1, loc) > score_threshold:
+        break
+      last_rd = rd
+    return best_loc
+
   def match_alphabet(self, pattern):
     """Initialise the alphabet for the Bitap algorithm.
 
@@ -1559,6 +1753,12 @@ class diff_match_patch:
     if not patches:
       return (text, [])
 
+    # Most patches are applied to the very text they were made from.  This
+    # path skips patch_splitMax, so it gives one result per patch passed in.
+    result = self.patch_applyExact(patches, text)
+    if result is not None:
+      return (result, [True] * len(patches))
+
     # Deep copy the patches so that no changes are made to originals.
     patches = self.patch_deepCopy(patches)
 
@@ -1633,6 +1833,59 @@ class diff_match_patch:
     text = text[len(nullPadding):-len(nullPadding)]
     return (text, results)
 
+  def patch_applyExact(self, patches, text):
+    """Merge a set of patches onto the text, if the context of every patch is
+    found exactly at its expected location.  Skips the copying, padding and
+    fuzzy matching of patch_apply, and builds the new text in one pass.
+    Gives the same text as patch_apply wherever it applies.
+
+    Args:
+      patches: Array of Patch objects.
+      text: Old text.
+
+    Returns:
+      The patched text, or None if any patch does not match exactly, or if
+      the contexts of two patches overlap.
+    """
+    if not patches:
+      return text
+
+    # A patch with less context than Patch_Margin at either end was made at
+    # the edge of the text, and must be applied at the same edge.
+    first_diff = patches[0].diffs[0] if patches[0].diffs else None
+    at_start = (first_diff is None or first_diff[0] != self.DIFF_EQUAL or
+                len(first_diff[1]) < self.Patch_Margin)
+    last_diff = patches[-1].diffs[-1] if patches[-1].diffs else None
+    at_end = (last_diff is None or last_diff[0] != self.DIFF_EQUAL or
+              len(last_diff[1]) < self.Patch_Margin)
+
+    result = []
+    # Position in the old text up to which the new text has been built.
+    pointer = 0
+    # Offset between the old text and the new text, as patched so far.
+    delta = 0
+    for patch in patches:
+      text1 = []
+      text2 = []
+      for (op, data) in patch.diffs:
+        if op != self.DIFF_INSERT:
+          text1.append(data)
+        if op != self.DIFF_DELETE:
+          text2.append(data)
+      text1 = "".join(text1)
+      start_loc = patch.start2 - delta
+      if (start_loc < pointer or start_loc > len(text) or
+          not text.startswith(text1, start_loc)):
+        return None
+      result.append(text[pointer:start_loc])
+      result.extend(text2)
+      pointer = start_loc + len(text1)
+      delta += sum(map(len, text2)) - len(text1)
+    if (at_start and patches[0].start2 != 0) or (at_end and pointer != len(text)):
+      return None
+    result.append(text[pointer:])
+    return "".join(result)
+
   def patch_addPadding(self, patches):
     """Add some padding on text start and end so that edges can match
     something.  Intended to be called only from within patch_apply.
@@ -1814,10 +2067,13 @@ class diff_match_patch:
     if not textline:
       return patches
     text = textline.split('\n')
-    while len(text) != 0:
-      m = re.match("^@@ -(\d+),?(\d*) \+(\d+),?(\d*) @@$", text[0])
+    # Walk the lines with a pointer; deleting each line from the front of
+    # the list would make parsing quadratic in the number of lines.
+    pointer = 0
+    while pointer < len(text):
+      m = self.PATCHHEADER.match(text[pointer])
       if not m:
-        raise ValueError("Invalid patch string: " + text[0])
+        raise ValueError("Invalid patch string: " + text[pointer])
       patch = patch_obj()
       patches.append(patch)
       patch.start1 = int(m.group(1))
@@ -1840,14 +2096,20 @@ class diff_match_patch:
         patch.start2 -= 1
         patch.length2 = int(m.group(4))
 
-      del text[0]
+      pointer += 1
 
-      while len(text) != 0:
-        if text[0]:
-          sign = text[0][0]
+      while pointer < len(text):
+        line = text[pointer]
+        if line:
+          sign = line[0]
         else:
           sign = ''
-        line = urllib.unquote(text[0][1:])
+        if sign == '@':
+          # Start of next patch.
+          break
+        line = line[1:]
+        if '%' in line:
+          line = urllib.unquote(line)
         line = line.decode("utf-8")
         if sign == '+':
           # Insertion.
@@ -1858,18 +2120,17 @@ class diff_match_patch:
         elif sign == ' ':
           # Minor equality.
           patch.diffs.append((self.DIFF_EQUAL, line))
-        elif sign == '@':
-          # Start of next patch.
-          break
         elif sign == '':
           # Blank line?  Whatever.
           pass
         else:
           # WTF?
           raise ValueError("Invalid patch mode: '%s'\n%s" % (sign, line))
-        del text[0]
+        pointer += 1
     return patches
 
+  PATCHHEADER = re.compile(r"^@@ -(\d+),?(\d*) \+(\d+),?(\d*) @@$")
+
 
 class patch_obj:
   """Class representing one patch operation.
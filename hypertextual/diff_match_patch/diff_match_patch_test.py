@@ -18,6 +18,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import random
 import sys
 import time
 import unittest
@@ -542,10 +543,31 @@ class DiffTest(DiffMatchPatchTest):
       # Exception expected.
       pass
 
+  def testDiffLineHunks(self):
+    # Null case.
+    self.assertEquals([], self.dmp.diff_lineHunks("", ""))
+
+    # Changed lines are rediffed by character.
+    a = "alpha\nbeta\ngamma\n"
+    b = "alpha\nbetas\ngamma\ndelta\n"
+    self.assertEquals([(self.dmp.DIFF_EQUAL, "alpha\nbeta"), (self.dmp.DIFF_INSERT, "s"), (self.dmp.DIFF_EQUAL, "\ngamma\n"), (self.dmp.DIFF_INSERT, "delta\n")], self.dmp.diff_lineHunks(a, b))
+
+    # Deleted lines.
+    self.assertEquals([(self.dmp.DIFF_EQUAL, "alpha\n"), (self.dmp.DIFF_DELETE, "beta\n"), (self.dmp.DIFF_EQUAL, "gamma\n")], self.dmp.diff_lineHunks(a, "alpha\ngamma\n"))
+
+    # Overlap line-mode.
+    a = "1234567890\n" * 13
+    b = "abcdefghij\n1234567890\n1234567890\n1234567890\nabcdefghij\n1234567890\n1234567890\n1234567890\nabcdefghij\n1234567890\n1234567890\n1234567890\nabcdefghij\n"
+    self.assertEquals((a, b), self.diff_rebuildtexts(self.dmp.diff_lineHunks(a, b)))
+
 
 class MatchTest(DiffMatchPatchTest):
   """MATCH TEST FUNCTIONS"""
 
+  def setUp(self):
+    DiffMatchPatchTest.setUp(self)
+    self.dmp.Match_BitapImpl = 'loop'
+
   def testMatchAlphabet(self):
     # Initialise the bitmasks for Bitap.
     self.assertEquals({"a":4, "b":2, "c":1}, self.dmp.match_alphabet("abc"))
@@ -630,6 +652,36 @@ class MatchTest(DiffMatchPatchTest):
       # Exception expected.
       pass
 
+    # Test unknown bitap implementations.
+    self.dmp.Match_BitapImpl = "Masks"
+    try:
+      self.dmp.match_main("abcdef", "abcdef", 0)
+      self.assertFalse(True)
+    except ValueError:
+      # Exception expected.
+      pass
+
+
+class MatchBitapMasksTest(MatchTest):
+  """MATCH TEST FUNCTIONS, with match_bitapMasks in place of match_bitap"""
+
+  def setUp(self):
+    MatchTest.setUp(self)
+    self.dmp.Match_BitapImpl = 'masks'
+    self.dmp.match_bitap = self.dmp.match_bitapMasks
+
+  def testMatchBitapSame(self):
+    # Both implementations find the same matches.
+    loop = dmp_module.diff_match_patch()
+    rand = random.Random(0)
+    for x in range(500):
+      text = "".join(rand.choice("abcd") for y in range(rand.randrange(1, 100)))
+      pattern = "".join(rand.choice("abcde") for y in range(rand.randrange(1, 33)))
+      loc = rand.randrange(len(text) + 1)
+      loop.Match_Distance = self.dmp.Match_Distance = rand.choice([0, 10, 100])
+      loop.Match_Threshold = self.dmp.Match_Threshold = rand.choice([0.0, 0.3, 0.5])
+      self.assertEquals(loop.match_bitap(text, pattern, loc), self.dmp.match_bitapMasks(text, pattern, loc))
+
 
 class PatchTest(DiffMatchPatchTest):
   """PATCH TEST FUNCTIONS"""
@@ -657,6 +709,10 @@ class PatchTest(DiffMatchPatchTest):
 
     self.assertEquals("@@ -0,0 +1,3 @@\n+abc\n", str(self.dmp.patch_fromText("@@ -0,0 +1,3 @@\n+abc\n")[0]))
 
+    # Multiple patches.
+    strp = "@@ -1,4 +1,4 @@\n-a\n+b\n bcd\n@@ -10,4 +10,5 @@\n wxy\n+%25\n z\n"
+    self.assertEquals(strp, self.dmp.patch_toText(self.dmp.patch_fromText(strp)))
+
     # Generates error.
     try:
       self.dmp.patch_fromText("Bad\nPatch\n")
@@ -743,6 +799,14 @@ class PatchTest(DiffMatchPatchTest):
     patches = self.dmp.patch_make(text1, text2)
     self.assertEquals(expectedPatch, self.dmp.patch_toText(patches))
 
+    # Line hunk diffs.
+    text1 = "".join(["line %d\n" % x for x in range(100)])
+    text2 = text1.replace("line 50\n", "line fifty\n")
+    expectedPatch = "@@ -392,10 +392,13 @@\n ine \n-50\n+fifty\n %0Alin\n"
+    patches = self.dmp.patch_make(text1, self.dmp.diff_lineHunks(text1, text2))
+    self.assertEquals(expectedPatch, self.dmp.patch_toText(patches))
+    self.assertEquals(text2, self.dmp.patch_apply(patches, text1)[0])
+
     # Test null inputs.
     try:
       self.dmp.patch_make(None, None)
@@ -864,6 +928,35 @@ class PatchTest(DiffMatchPatchTest):
     results = self.dmp.patch_apply(patches, "x")
     self.assertEquals(("x123", [True]), results)
 
+  def testPatchApplyExact(self):
+    # Null case.
+    self.assertEquals("Hello world.", self.dmp.patch_applyExact([], "Hello world."))
+
+    # Exact match.
+    patches = self.dmp.patch_make("The quick brown fox jumps over the lazy dog.", "That quick brown fox jumped over a lazy dog.")
+    self.assertEquals("That quick brown fox jumped over a lazy dog.", self.dmp.patch_applyExact(patches, "The quick brown fox jumps over the lazy dog."))
+
+    # Partial match.
+    self.assertEquals(None, self.dmp.patch_applyExact(patches, "The quick red rabbit jumps over the tired tiger."))
+
+    # Context found, but away from the expected location.
+    patches = self.dmp.patch_make("abcdefghijklmnopqrstuvwxyz", "abcdefghijklm123nopqrstuvwxyz")
+    self.assertEquals(None, self.dmp.patch_applyExact(patches, "--abcdefghijklmnopqrstuvwxyz"))
+    self.assertEquals(("--abcdefghijklm123nopqrstuvwxyz", [True]), self.dmp.patch_apply(patches, "--abcdefghijklmnopqrstuvwxyz"))
+
+    # Edge patches must be applied at the edges.
+    patches = self.dmp.patch_make("", "test")
+    self.assertEquals("test", self.dmp.patch_applyExact(patches, ""))
+    self.assertEquals(None, self.dmp.patch_applyExact(patches, "XY"))
+    patches = self.dmp.patch_make("XY", "XYtest")
+    self.assertEquals(None, self.dmp.patch_applyExact(patches, "XYZ"))
+
+    # No side effects.
+    patches = self.dmp.patch_make("The quick brown fox jumps over the lazy dog.", "Woof")
+    patchstr = self.dmp.patch_toText(patches)
+    self.assertEquals("Woof", self.dmp.patch_applyExact(patches, "The quick brown fox jumps over the lazy dog."))
+    self.assertEquals(patchstr, self.dmp.patch_toText(patches))
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,9 @@
+# gunicorn settings; see the Procfile
+
+# load the app once in the master, so workers fork with it configured
+preload_app = True
+
+def post_fork(server, worker):
+    # give each worker its own database connections, opened up front
+    import hypertextual
+    hypertextual.warm_up_db_pool()
@@ -1,9 +1,13 @@
-import os, re, argparse
-from flask import Flask, request, session, g, redirect, url_for, abort
+import os, re, time, hashlib, argparse
+from functools import wraps
+from flask import Flask, Response, request, session, g, redirect, url_for, abort, has_request_context
 from chameleon import PageTemplateLoader
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
 from markdown import markdown
-from models import db_session, Page, Account, Breadcrumb
+from models import db_session, RoutingSession, render_cache, acct_cache, redirect_cache, \
+    configure_revisions, Page, Account, Breadcrumb
 from validate_email import validate_email
 from models import reserved_acct_names
 
@@ -14,6 +18,35 @@ site_name = None
 site_url = None
 app_path = None
 templates = None
+read_only_endpoints = set()
+conflict_retries = 3
+
+##### decorators
+
+def read_only(f):
+    # mark a view as never writing to the database; GET requests to it
+    # end with a rollback rather than a commit, may run in a read-only
+    # transaction (see READ_ONLY_TRANSACTIONS), and may be served by a
+    # read replica (see CONN_STR_REPLICAS)
+    read_only_endpoints.add(f.__name__)
+    return f
+
+def retry_on_conflict(f):
+    # re-run a handler, in a fresh transaction, when its writes violate a
+    # unique constraint because a concurrent request got there first (e.g.,
+    # two requests choosing the same page slug)
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        for attempt in range(conflict_retries):
+            try:
+                response = f(*args, **kwargs)
+                db_session.flush()
+                return response
+            except exc.IntegrityError:
+                db_session.rollback()
+                if attempt == conflict_retries - 1:
+                    raise
+    return wrapper
 
 ##### routes
 
@@ -38,6 +71,7 @@ templates = None
 # /<uid>/<slug>/action/...  --> page action
 
 @app.route('/')
+@read_only
 def site_home():
     md_path = '%s/index.md' % app_path
     doc_html = get_html_from_markdown_file(md_path, '')
@@ -60,11 +94,13 @@ def _get_user_list_for_site_home():
 @app.route('/sitemap.xml/')
 @app.route('/dublin.rdf/')
 @app.route('/opensearch.xml/')
+@read_only
 def reserved_names():
     abort(404)
 
 @app.route('/docs/', defaults={'title': 'index'}, methods=['GET'])
 @app.route('/docs/<title>/', methods=['GET'])
+@read_only
 def read_doc(title):
     md_path = '%s/docs/%s.md' % (app_path, title)
     doc_html = get_html_from_markdown_file(md_path)
@@ -99,7 +135,7 @@ def login():
             valid = acct.validate_password(pw)
             if valid:
                 # add account to session
-                session['current_uid'] = acct.uid
+                session['current_acct_id'] = acct.id
                 g.current_user = acct
                 # redirect to user home
                 return redirect_to_user_page(uid, '__home')
@@ -113,7 +149,7 @@ def login():
 
 @app.route('/site/logout/')
 def logout():
-    del session['current_uid']
+    session.pop('current_acct_id', None)
     g.current_user = None
     return redirect_to_site_home()
 
@@ -170,9 +206,10 @@ def create_acct():
 
             # create account
             acct = Account.new(uid, pw, email)
+            db_session.flush()
 
             # add account to session (effectively log the new user in)
-            session['current_uid'] = acct.uid
+            session['current_acct_id'] = acct.id
             g.current_user = acct
 
             # redirect to new home page
@@ -217,6 +254,8 @@ def change_password(uid):
             valid = False
             errors['pconfirm'] = 'Does not match new password.'
         else:
+            # validate against the stored password, not a cached copy
+            db_session.refresh(g.current_user)
             valid = g.current_user.reset_password(curr_pw, new_pw)
             if not valid:
                 errors['curr_pw'] = 'Invalid password.'
@@ -244,10 +283,8 @@ def create_page(uid):
     if not g.current_user or uid != g.current_user.uid:
         return redirect_to_user_page(uid, '__home')
 
-    # get account by uid; abort if not found
-    acct = Account.get_by_uid(uid)
-    if acct is None:
-        abort(404)
+    # the current user owns the account
+    acct = g.current_user
 
     # redirect to the page if the title exists
     page = acct.get_page_by_title(title)
@@ -263,18 +300,14 @@ def create_page(uid):
 @app.route('/<uid>/', defaults={'slug': '__home'})
 @app.route('/_<uid>/', defaults={'slug': '__private'})
 @app.route('/<uid>/<slug>/')
+@read_only
 def view_page(uid, slug):
 
     # get request args
     rev_num = request.args.get('rev', '').strip()
 
-    # get account by uid; abort if not found
-    acct = Account.get_by_uid(uid)
-    if acct is None:
-        abort(404)
-
-    # get page by slug; abort if not found
-    page = acct.get_page_by_slug(slug)
+    # get page (with its account and current rev) by uid and slug; abort if not found
+    page = Page.get_by_slug(uid, slug)
     if page is None:
         abort(404)
 
@@ -282,6 +315,12 @@ def view_page(uid, slug):
     if not page.user_can_view(g.current_user):
         abort(404)
 
+    # redirect to the page this one redirects to, if any
+    if rev_num == '' and page.redirect_page_id is not None:
+        redirect_url = _get_redirect_url(page)
+        if redirect_url is not None:
+            return redirect(redirect_url, 301)
+
     if rev_num == '':
         rev_num = None
     else:
@@ -292,18 +331,29 @@ def view_page(uid, slug):
             rev_num = -1
     return render_page_view(page, rev_num)
 
+def _get_redirect_url(page):
+    # a cached url is used only while the page still redirects to the same
+    # target, and its render_gen shows that the target has not changed since;
+    # only redirects that anyone may follow are cached
+    cache_key = (page.acct.uid, page.slug)
+    cached = redirect_cache.get(cache_key)
+    if cached is not None and cached[1:] == (page.redirect_page_id, page.render_gen):
+        return cached[0]
+    if not page.redirect_page.user_can_view(g.current_user):
+        return None
+    redirect_url = page.redirect_page.get_url()
+    if page.user_can_view(None) and page.redirect_page.user_can_view(None):
+        tags = [('page', page.id), ('page', page.redirect_page_id)]
+        redirect_cache.set(cache_key, (redirect_url, page.redirect_page_id, page.render_gen), tags)
+    return redirect_url
+
 @app.route('/<uid>/action/edit/', defaults={'slug': '__home'}, methods=['POST', 'GET'])
 @app.route('/_<uid>/action/edit/', defaults={'slug': '__private'}, methods=['POST', 'GET'])
 @app.route('/<uid>/<slug>/action/edit/', methods=['POST', 'GET'])
 def edit_page(uid, slug):
 
-    # get account by uid; abort if not found
-    acct = Account.get_by_uid(uid)
-    if acct is None:
-        abort(404)
-
-    # get page by slug; abort if not found
-    page = acct.get_page_by_slug(slug)
+    # get page (with its account and current rev) by uid and slug; abort if not found
+    page = Page.get_by_slug(uid, slug)
     if page is None:
         abort(404)
 
@@ -324,13 +374,8 @@ def move_page(uid, slug):
     if slug in ['__home','__private']:
         abort(404)
 
-    # get account by uid; abort if not found
-    acct = Account.get_by_uid(uid)
-    if acct is None:
-        abort(404)
-
-    # get page by slug; abort if not found
-    page = acct.get_page_by_slug(slug)
+    # get page (with its account and current rev) by uid and slug; abort if not found
+    page = Page.get_by_slug(uid, slug)
     if page is None:
         abort(404)
 
@@ -351,13 +396,8 @@ def delete_page(uid, slug):
     if slug in ['__home','__private']:
         abort(404)
 
-    # get account by uid; abort if not found
-    acct = Account.get_by_uid(uid)
-    if acct is None:
-        abort(404)
-
-    # get page by slug; abort if not found
-    page = acct.get_page_by_slug(slug)
+    # get page (with its account and current rev) by uid and slug; abort if not found
+    page = Page.get_by_slug(uid, slug)
     if page is None:
         abort(404)
 
@@ -371,6 +411,23 @@ def delete_page(uid, slug):
     elif request.method == 'POST':
         return handle_page_delete(page)
 
+@app.route('/<uid>/action/backlinks/', defaults={'slug': '__home'})
+@app.route('/_<uid>/action/backlinks/', defaults={'slug': '__private'})
+@app.route('/<uid>/<slug>/action/backlinks/')
+@read_only
+def list_backlinks(uid, slug):
+
+    # get page (with its account and current rev) by uid and slug; abort if not found
+    page = Page.get_by_slug(uid, slug)
+    if page is None:
+        abort(404)
+
+    # check user access
+    if not page.user_can_view(g.current_user):
+        abort(404)
+
+    return render_page_backlinks(page)
+
 def render_page_view(page, rev_num=None):
 
     # determine the rev num; redirect if it doesn't exist
@@ -379,13 +436,22 @@ def render_page_view(page, rev_num=None):
     elif rev_num < 0 or rev_num > page.curr_rev_num:
         return redirect_to_user_page(page.acct.uid, page.slug)
 
-    # get the revision and render it as html for display
+    # get the revision and render it as html for display, unless the client
+    # already has this exact view; only views of the current rev get an etag,
+    # since render_gen does not follow the pages that older revs link to
     page_html = ''
+    etag = None
     if rev_num is not None:
         current_uid = None
         if g.current_user:
             current_uid = g.current_user.uid
-        rev = page.revs[rev_num]
+        rev = page.get_rev(rev_num)
+        if rev_num == page.curr_rev_num:
+            etag = _get_page_view_etag(page, rev, current_uid)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
         page_html = rev.render_to_html(current_uid)
 
     # return the rendered page template
@@ -396,7 +462,21 @@ def render_page_view(page, rev_num=None):
         'page_html': page_html,
         'breadcrumb': page.get_breadcrumb(),
     }
-    return render_template('page_view.html', **vals)
+    response = Response(render_template('page_view.html', **vals), mimetype='text/html')
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+def _get_page_view_etag(page, rev, current_uid):
+    # a strong etag for a view of the current rev: the content hash and rev id
+    # cover the text and its links, render_gen covers the pages it links to, and
+    # the rest covers the page itself and the viewer
+    etag_parts = (
+        rev.id, rev.content_hash, rev.use_markdown, page.render_gen,
+        page.title, page.slug, page.private, page.curr_rev_num, current_uid,
+    )
+    etag = hashlib.sha1(repr(etag_parts)).hexdigest()
+    return etag
 
 def render_page_create(acct, title):
 
@@ -413,6 +493,7 @@ def render_page_create(acct, title):
     }
     return render_template('page_edit.html', **vals)
 
+@retry_on_conflict
 def handle_page_create(acct, title):
 
     # get form values
@@ -450,16 +531,19 @@ def render_page_move(page):
         'page_uid': page.acct.uid,
         'new_title': page.title,
         'create_redirect': False,
+        'update_links': False,
         'breadcrumb': page.get_breadcrumb(),
         'errors': {},
     }
     return render_template('page_move.html', **vals)
 
+@retry_on_conflict
 def handle_page_move(page):
 
     # get form values
     new_title = request.form['new_title']
     create_redirect = request.form.has_key('create_redirect')
+    update_links = request.form.has_key('update_links')
     cancel = request.form.has_key('cancel')
 
     if cancel:
@@ -481,17 +565,34 @@ def handle_page_move(page):
             'page_uid': page.acct.uid,
             'new_title': new_title,
             'create_redirect': create_redirect,
+            'update_links': update_links,
             'breadcrumb': page.get_breadcrumb(),
             'errors': errors,
         }
         return render_template('page_move.html', **vals)
 
     # move page
-    Page.move(page, new_title, create_redirect)
+    Page.move(page, new_title, create_redirect, update_links)
 
     # redirect to view page
     return redirect_to_user_page(page.acct.uid, page.slug)
 
+def render_page_backlinks(page):
+
+    # list the linking pages the user can view
+    linking_pages = [
+        linking_page for linking_page in page.get_backlinks()
+        if linking_page.user_can_view(g.current_user)
+    ]
+
+    vals = {
+        'page': page,
+        'page_uid': page.acct.uid,
+        'linking_pages': linking_pages,
+        'breadcrumb': page.get_breadcrumb(),
+    }
+    return render_template('page_backlinks.html', **vals)
+
 def render_page_delete(page):
     vals = {
         'page': page,
@@ -589,18 +690,44 @@ def render_template(template_name, **vals):
 
 @app.before_request
 def before_request():
+    if _is_read_only_request() and not _primary_is_sticky():
+        db_session().use_replica()
     g.current_user = _get_current_user_from_session()
 
+def _primary_is_sticky():
+    # a user's reads stay on the primary for a few seconds after they
+    # write, so that they see their own changes despite replication lag
+    primary_until = session.get('primary_until', 0)
+    return time.time() < primary_until
+
 def _get_current_user_from_session():
-    # retrieve current_uid from session, where it is kept between requests
-    current_uid = session.get('current_uid', None)
+    # retrieve current_acct_id from session, where it is kept between requests
+    current_acct_id = session.get('current_acct_id', None)
     current_user = None
-    if current_uid:
-        current_user = Account.get_by_uid(current_uid)
+    if current_acct_id:
+        current_user = Account.get_by_id(current_acct_id)
     return current_user
 
+def _is_read_only_request():
+    return request.method in ('GET', 'HEAD') and request.endpoint in read_only_endpoints
+
+def _set_transaction_read_only(session, transaction, connection):
+    # have the database reject writes made while serving a read-only request
+    if has_request_context() and _is_read_only_request():
+        connection.execute('SET TRANSACTION READ ONLY')
+
+@app.after_request
+def after_request(response):
+    if RoutingSession.replicas and request.method == 'POST':
+        session['primary_until'] = time.time() + app.config['PRIMARY_STICKY_SECONDS']
+    return response
+
 @app.teardown_request
 def teardown_request(exception=None):
+    # read-only requests have nothing to commit
+    if _is_read_only_request():
+        db_session.rollback()
+        return
     try:
         db_session.commit()
     except:
@@ -622,6 +749,8 @@ def page_not_found(e):
 def main():
     _configure_flask_app()
     _configure_db_session()
+    _configure_revisions()
+    _configure_caches()
     _set_globals()
     command_line_args = _get_command_line_args()
     app_options = _get_app_options(command_line_args)
@@ -631,6 +760,8 @@ def main():
 def wsgi_main():
     _configure_flask_app()
     _configure_db_session()
+    _configure_revisions()
+    _configure_caches()
     _set_globals()
     _set_up_logging()
 
@@ -639,8 +770,73 @@ def _configure_flask_app():
 
 def _configure_db_session():
     conn_str = app.config['CONN_STR']
-    engine = create_engine(conn_str)
+    engine = _create_engine(conn_str)
     db_session.configure(bind=engine)
+    RoutingSession.replicas = [
+        _create_engine(replica_conn_str)
+        for replica_conn_str in app.config['CONN_STR_REPLICAS']
+    ]
+    if app.config['READ_ONLY_TRANSACTIONS']:
+        event.listen(db_session, 'after_begin', _set_transaction_read_only)
+
+def _create_engine(conn_str):
+    url = make_url(conn_str)
+    engine_options = {}
+    connect_args = {}
+    # pool settings apply only to dialects that pool connections (not sqlite files)
+    if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        engine_options['pool_size'] = app.config['DB_POOL_SIZE']
+        engine_options['max_overflow'] = app.config['DB_MAX_OVERFLOW']
+        engine_options['pool_timeout'] = app.config['DB_POOL_TIMEOUT']
+        engine_options['pool_recycle'] = app.config['DB_POOL_RECYCLE']
+    if url.drivername.startswith('postgresql') and app.config['DB_STATEMENT_TIMEOUT']:
+        connect_args['options'] = '-c statement_timeout=%d' % app.config['DB_STATEMENT_TIMEOUT']
+    engine = create_engine(conn_str, connect_args=connect_args, **engine_options)
+    if app.config['DB_POOL_PRE_PING']:
+        event.listen(engine.pool, 'checkout', _ping_connection)
+    return engine
+
+def _ping_connection(dbapi_connection, connection_record, connection_proxy):
+    # test each connection as it is checked out of the pool; raising
+    # DisconnectionError makes the pool replace a dead one and retry
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    except Exception:
+        raise exc.DisconnectionError()
+    finally:
+        cursor.close()
+
+def warm_up_db_pool():
+    # called in each worker after it is forked (see gunicorn_config.py):
+    # drop any connections inherited from the parent process, then open
+    # the pools' connections before the worker starts taking requests
+    for engine in [db_session.bind] + RoutingSession.replicas:
+        engine.dispose()
+        try:
+            conns = [engine.connect() for i in range(app.config['DB_POOL_SIZE'])]
+        except exc.OperationalError:
+            app.logger.exception('could not warm up the database connection pool')
+            continue
+        for conn in conns:
+            conn.close()
+
+def _configure_revisions():
+    configure_revisions(app.config)
+
+def _configure_caches():
+    render_cache.configure(
+        max_size=app.config['RENDER_CACHE_SIZE'],
+        ttl=app.config['RENDER_CACHE_TTL']
+    )
+    acct_cache.configure(
+        max_size=app.config['ACCT_CACHE_SIZE'],
+        ttl=app.config['ACCT_CACHE_TTL']
+    )
+    redirect_cache.configure(
+        max_size=app.config['REDIRECT_CACHE_SIZE'],
+        ttl=app.config['REDIRECT_CACHE_TTL']
+    )
 
 def _set_globals():
     global site_name, site_url, app_path, templates
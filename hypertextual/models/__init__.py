@@ -1,7 +1,10 @@
-from db import db_session, Base
+from db import db_session, Base, RoutingSession
+from cache import Cache, render_cache, acct_cache, redirect_cache
+from diff import DiffBackend, diff_backends, auto_diff_backend
 from acct import Account
 from breadcrumb import Breadcrumb
-from page import Page
-from rev import Revision
+from page import Page, configure_revisions
+from rev import Revision, RevisionIntegrityError
 from link import Link
+from backlink import Backlink
 from reserved import reserved_page_names, reserved_acct_names
\ No newline at end of file
@@ -1,9 +1,11 @@
 from flaskext.bcrypt import generate_password_hash, check_password_hash
 from datetime import datetime
 from sqlalchemy import Column, Integer, String, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, class_mapper
+from sqlalchemy.orm.attributes import manager_of_class, instance_state, set_committed_value
 from sqlalchemy.sql import exists
 from breadcrumb import Breadcrumb
+from cache import acct_cache
 from db import Base, db_session
 from page import Page
 
@@ -38,6 +40,7 @@ class Account(Base):
         valid = self.validate_password(old_password)
         if valid:
             self.set_password(new_password)
+            acct_cache.delete(self.id)
         return valid
 
     def validate_password(self, password):
@@ -69,6 +72,29 @@ class Account(Base):
         acct = cls.query.filter(cls.uid==uid).first()
         return acct
 
+    @classmethod
+    def get_by_id(cls, acct_id):
+        # serve a detached copy of the account from the cache, merged into
+        # the current session without a query; only column attributes are
+        # cached, so relationships still load lazily from the session
+        cached_acct = acct_cache.get(acct_id)
+        if cached_acct is None:
+            acct = cls.query.get(acct_id)
+            if acct is not None:
+                acct_cache.set(acct_id, acct.__copy_columns())
+            return acct
+        acct = db_session.merge(cached_acct, load=False)
+        return acct
+
+    def __copy_columns(self):
+        # a detached copy holding only the column attributes, with the
+        # identity of this account, and never any loaded pages or revs
+        acct = manager_of_class(Account).new_instance()
+        for prop in class_mapper(Account).column_attrs:
+            set_committed_value(acct, prop.key, getattr(self, prop.key))
+        instance_state(acct).key = instance_state(self).key
+        return acct
+
     @classmethod
     def get_all(cls):
         accts = cls.query.order_by(cls.uid).all()
@@ -0,0 +1,50 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+from db import Base, db_session
+
+class Backlink(Base):
+
+    # one row for each page linked to by the current published rev of a
+    # page, so that the pages linking to a page can be found without
+    # replaying revisions; rebuilt whenever a page publishes a rev
+
+    # table
+    __tablename__ = 'backlink'
+    __table_args__ = (
+        Index('ix_backlink_src_page_id', 'src_page_id'),
+        Index('ix_backlink_tgt_page_uid_tgt_page_title', 'tgt_page_uid', 'tgt_page_title'),
+    )
+
+    # columns
+    id = Column(Integer, primary_key=True, nullable=False)
+    src_page_id = Column(Integer, ForeignKey('page.id', ondelete='CASCADE'), nullable=False)
+
+    tgt_page_uid = Column(String(64), nullable=False)
+    tgt_page_title = Column(String(1024), nullable=False)
+
+    # relationships
+    src_page = None #-> Page.outlinks
+
+    @classmethod
+    def get_src_page_ids(cls, uid, title):
+        rows = db_session.query(cls.src_page_id).\
+            filter(cls.tgt_page_uid==uid).\
+            filter(cls.tgt_page_title==title).all()
+        src_page_ids = [src_page_id for (src_page_id,) in rows]
+        return src_page_ids
+
+    @classmethod
+    def retitle(cls, uid, title, new_title):
+        cls.query.\
+            filter(cls.tgt_page_uid==uid).\
+            filter(cls.tgt_page_title==title).\
+            update({cls.tgt_page_title: new_title}, synchronize_session=False)
+        for obj in db_session.identity_map.values():
+            if isinstance(obj, cls):
+                db_session.expire(obj, ['tgt_page_title'])
+
+    @classmethod
+    def new(cls, uid, title):
+        backlink = cls()
+        backlink.tgt_page_uid = uid
+        backlink.tgt_page_title = title
+        return backlink
@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+from threading import RLock
+
+class Cache(object):
+
+    # an in-process, thread-safe cache with a size limit and a ttl;
+    # values may be stored with tags, and invalidating a tag drops every
+    # value stored with it. the oldest values are evicted first when full.
+
+    def __init__(self, max_size=1000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.__entries = OrderedDict() # key -> (expires, value, tags)
+        self.__keys_by_tag = {}
+        self.__lock = RLock()
+
+    def configure(self, max_size=None, ttl=None):
+        with self.__lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if ttl is not None:
+                self.ttl = ttl
+            self.clear()
+
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            expires, value, tags = entry
+            if expires < time.time():
+                self.delete(key)
+                return None
+            return value
+
+    def set(self, key, value, tags=()):
+        if not self.max_size:
+            return
+        with self.__lock:
+            self.delete(key)
+            while len(self.__entries) >= self.max_size:
+                oldest_key = next(iter(self.__entries))
+                self.delete(oldest_key)
+            tags = frozenset(tags)
+            self.__entries[key] = (time.time() + self.ttl, value, tags)
+            for tag in tags:
+                self.__keys_by_tag.setdefault(tag, set()).add(key)
+
+    def delete(self, key):
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is not None:
+                for tag in entry[2]:
+                    keys = self.__keys_by_tag.get(tag)
+                    keys.discard(key)
+                    if not keys:
+                        del self.__keys_by_tag[tag]
+
+    def invalidate(self, tag):
+        with self.__lock:
+            for key in list(self.__keys_by_tag.get(tag, ())):
+                self.delete(key)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__keys_by_tag.clear()
+
+# rendered html of revisions, keyed by (rev id, use_markdown, viewer category,
+# page render_gen) and tagged with ('rev', rev id)
+render_cache = Cache()
+
+# detached copies of accounts, keyed by account id, so that the session user
+# can be loaded without a query; merged into the db session on each request
+acct_cache = Cache(ttl=60)
+
+# urls that redirect pages redirect to, keyed by the (uid, slug) of the redirect
+# page and tagged with ('page', page id) for both the redirect page and its target;
+# stored with the redirect page's redirect_page_id and render_gen, which must
+# still match the page for the url to be used
+redirect_cache = Cache()
@@ -1,6 +1,28 @@
+import random
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker, Session
 
-db_session = scoped_session(sessionmaker())
+class RoutingSession(Session):
+
+    # a session that can send all of its queries to a read replica, for
+    # requests that only read; otherwise it uses its bind (the primary)
+
+    # engines for the read replicas, if any are configured
+    replicas = []
+
+    def __init__(self, **kwargs):
+        Session.__init__(self, **kwargs)
+        self.replica = None
+
+    def use_replica(self):
+        if self.replicas:
+            self.replica = random.choice(self.replicas)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.replica is not None:
+            return self.replica
+        return Session.get_bind(self, mapper, clause)
+
+db_session = scoped_session(sessionmaker(class_=RoutingSession))
 Base = declarative_base()
 Base.query = db_session.query_property()
\ No newline at end of file
@@ -0,0 +1,61 @@
+from diff_match_patch.diff_match_patch import diff_match_patch
+
+class DiffBackend(object):
+
+    # computes the edits that turn one raw text into another, as a list of
+    # diff_match_patch (op, text) tuples, from which revision patches are made;
+    # the edits come back cleaned up for efficiency, and also for readability
+    # when semantic is set (as for text patches)
+
+    def diff(self, text1, text2, semantic=False):
+        raise NotImplementedError
+
+class CharDiffBackend(DiffBackend):
+
+    # the vendored diff_match_patch engine, which finds the smallest edits
+    # by character, but whose bisection is slow on large texts that differ
+    # in many places
+
+    def diff(self, text1, text2, semantic=False):
+        dmp = diff_match_patch()
+        diffs = dmp.diff_main(text1, text2)
+        if semantic and len(diffs) > 2:
+            dmp.diff_cleanupSemantic(diffs)
+        dmp.diff_cleanupEfficiency(diffs)
+        return diffs
+
+class LineDiffBackend(DiffBackend):
+
+    # diff_match_patch over whole lines, rediffing only the changed lines by
+    # character, so that its cost follows the size of the changes rather
+    # than the size of the texts; each changed hunk is already cleaned up on
+    # its own, so the whole diff is never cleaned up again
+
+    def diff(self, text1, text2, semantic=False):
+        return diff_match_patch().diff_lineHunks(text1, text2)
+
+class AutoDiffBackend(DiffBackend):
+
+    # diffs by character, or by line once the two texts together reach
+    # line_mode_threshold characters (0 = never)
+
+    def __init__(self, char_backend, line_backend, line_mode_threshold=100000):
+        self.char_backend = char_backend
+        self.line_backend = line_backend
+        self.line_mode_threshold = line_mode_threshold
+
+    def diff(self, text1, text2, semantic=False):
+        if self.line_mode_threshold and len(text1) + len(text2) >= self.line_mode_threshold:
+            return self.line_backend.diff(text1, text2, semantic)
+        return self.char_backend.diff(text1, text2, semantic)
+
+char_diff_backend = CharDiffBackend()
+line_diff_backend = LineDiffBackend()
+auto_diff_backend = AutoDiffBackend(char_diff_backend, line_diff_backend)
+
+# the backends that can be selected by name in config
+diff_backends = {
+    'char': char_diff_backend,
+    'line': line_diff_backend,
+    'auto': auto_diff_backend,
+}
@@ -1,5 +1,6 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index, and_, or_
+from sqlalchemy.orm import relationship, contains_eager, joinedload
 from markdown.util import etree
 from sqlalchemy.orm.exc import NoResultFound
 from db import Base, db_session
@@ -8,6 +9,11 @@ class Link(Base):
 
     # table
     __tablename__ = 'link'
+    __table_args__ = (
+        Index('ix_link_rev_id', 'rev_id'),
+        Index('ix_link_tgt_page_uid_tgt_page_title', 'tgt_page_uid', 'tgt_page_title'),
+        Index('ix_link_tgt_page_id', 'tgt_page_id'),
+    )
 
     # columns
     id = Column(Integer, primary_key=True, nullable=False)
@@ -18,9 +24,15 @@ class Link(Base):
     tgt_page_uid = Column(String(64))
     tgt_page_title = Column(String(1024), nullable=False)
     tgt_page_alias = Column(String(1024)) # todo: put some check in place to deal with longer aliases
+    tgt_page_id = Column(Integer, ForeignKey('page.id', ondelete='SET NULL')) # null if the target doesn't exist
+
+    # rows per multi-row INSERT when saving links in bulk (sqlite allows
+    # at most 999 parameters per statement)
+    insert_batch_size = 100
 
     # relationships
     rev = None #-> Revision.links
+    tgt_page = relationship('Page', primaryjoin='Link.tgt_page_id==Page.id')
 
     def get_link_text(self):
         # return link text in the form `[[uid::title|alias]]`
@@ -37,8 +49,17 @@ class Link(Base):
         # return link placeholder in the form `[[link_num]]`
         return '[[%s]]' % self.link_num
 
-    def get_link_html(self, current_uid):
-        url, display_text, classes = self.__get_link_components(current_uid)
+    def get_spec(self):
+        # return the (uid, title, alias) that the link is stored with
+        return self.tgt_page_uid, self.tgt_page_title, self.tgt_page_alias
+
+    def get_tgt_page_key(self):
+        # return the (uid, title) of the target page
+        uid = self.tgt_page_uid or self.rev.page.acct.uid
+        return uid, self.tgt_page_title
+
+    def get_link_html(self, current_uid, targets=None):
+        url, display_text, classes = self.__get_link_components(current_uid, targets)
         class_html = ''
         if classes:
             class_text = ' '.join(classes)
@@ -46,8 +67,8 @@ class Link(Base):
         html = '<a href="%s"%s>%s</a>' % (url, class_html, display_text)
         return html
 
-    def get_link_markdown_elem(self, current_uid):
-        url, display_text, classes = self.__get_link_components(current_uid)
+    def get_link_markdown_elem(self, current_uid, targets=None):
+        url, display_text, classes = self.__get_link_components(current_uid, targets)
         a = etree.Element('a')
         a.text = display_text
         a.set('href', url)
@@ -56,18 +77,16 @@ class Link(Base):
             a.set('class', class_text)
         return a
 
-    def __get_link_components(self, current_uid):
-        # return a url, display text, and relevant css classes for this link
+    def __get_link_components(self, current_uid, targets):
+        # return a url, display text, and relevant css classes for this link;
+        # targets may hold the pre-resolved target pages of all links in a rev
 
-        from acct import Account
-        from page import Page
+        if targets is None:
+            targets = Link.resolve_targets([self])
 
         page_uid = self.rev.page.acct.uid
-        link_uid = self.tgt_page_uid or page_uid
-        page = Page.query.\
-            join(Account.pages).\
-            filter(Page.title==self.tgt_page_title, Account.uid==link_uid).\
-            first()
+        link_uid, title = self.get_tgt_page_key()
+        page = targets.get((link_uid, title))
 
         can_create = (page is None and page_uid == current_uid and link_uid == current_uid)
         can_view = (page is not None and page.user_can_view(current_uid))
@@ -94,15 +113,178 @@ class Link(Base):
             classes.append('link-does-not-exist')
         return classes
 
+    @classmethod
+    def resolve_targets(cls, links):
+        # return the target pages of the given links (with their accounts),
+        # keyed by (uid, title); targets are resolved to page ids when links
+        # are saved, so this loads any not already loaded by primary key,
+        # in a single query
+
+        from page import Page
+
+        unresolved_links = [
+            link for link in links
+            if link.id is None and 'tgt_page' not in link.__dict__
+        ]
+        if unresolved_links:
+            cls.set_tgt_pages(unresolved_links)
+
+        tgt_page_ids = set(
+            link.tgt_page_id for link in links
+            if link.tgt_page_id is not None and 'tgt_page' not in link.__dict__
+        )
+        if tgt_page_ids:
+            Page.query.\
+                options(joinedload(Page.acct)).\
+                filter(Page.id.in_(tgt_page_ids)).all()
+
+        targets = {}
+        for link in links:
+            page = link.tgt_page # from the identity map, without a query
+            if page is not None:
+                targets[link.get_tgt_page_key()] = page
+        return targets
+
+    @classmethod
+    def set_tgt_pages(cls, links):
+        # resolve the target pages of newly created links, in a single query
+        pages_by_key = cls.__get_pages_by_key(
+            [link.get_tgt_page_key() for link in links]
+        )
+        for link in links:
+            link.tgt_page = pages_by_key.get(link.get_tgt_page_key())
+
+    @classmethod
+    def __get_pages_by_key(cls, tgt_page_keys):
+        # look up pages (with their accounts) by (uid, title), in a single query
+
+        from acct import Account
+        from page import Page
+
+        titles_by_uid = {}
+        for uid, title in tgt_page_keys:
+            titles_by_uid.setdefault(uid, set()).add(title)
+
+        pages_by_key = {}
+        if titles_by_uid:
+            pages = Page.query.\
+                join(Page.acct).\
+                options(contains_eager(Page.acct)).\
+                filter(or_(*[
+                    and_(Account.uid==uid, Page.title.in_(titles))
+                    for uid, titles in titles_by_uid.items()
+                ])).all()
+            for page in pages:
+                pages_by_key[(page.acct.uid, page.title)] = page
+        return pages_by_key
+
+    @classmethod
+    def insert_links(cls, rev, specs_by_link_num):
+        # insert the rev's links from their (uid, title, alias) specs using
+        # multi-row INSERTs, resolving their target pages first
+
+        acct_uid = rev.page.acct.uid
+        pages_by_key = cls.__get_pages_by_key(
+            [(uid or acct_uid, title) for uid, title, alias in specs_by_link_num.values()]
+        )
+
+        create_ts = datetime.now()
+        rows = []
+        for link_num, (uid, title, alias) in sorted(specs_by_link_num.items()):
+            page = pages_by_key.get((uid or acct_uid, title))
+            rows.append({
+                'rev_id': rev.id,
+                'create_ts': create_ts,
+                'link_num': link_num,
+                'tgt_page_uid': uid,
+                'tgt_page_title': title,
+                'tgt_page_alias': alias,
+                'tgt_page_id': page.id if page is not None else None,
+            })
+        for i in range(0, len(rows), cls.insert_batch_size):
+            db_session.execute(
+                cls.__table__.insert().values(rows[i:i+cls.insert_batch_size])
+            )
+
+    @classmethod
+    def delete_links(cls, rev, link_nums):
+        db_session.execute(
+            cls.__table__.delete().
+                where(cls.rev_id==rev.id).
+                where(cls.link_num.in_(link_nums))
+        )
+
+    @classmethod
+    def link_to_page(cls, page):
+        # point the unresolved links that target the page's title at the page
+        from page import Page
+        from rev import Revision
+        db_session.flush() # assigns the page an id
+        same_acct_rev_ids = db_session.query(Revision.id).\
+            join(Revision.page).\
+            filter(Page.acct_id==page.acct_id)
+        query = cls.query.\
+            filter(cls.tgt_page_id==None).\
+            filter(cls.tgt_page_title==page.title).\
+            filter(or_(
+                cls.tgt_page_uid==page.acct.uid,
+                and_(cls.tgt_page_uid==None, cls.rev_id.in_(same_acct_rev_ids))
+            ))
+        cls.__update_tgt_page_ids(query, page.id)
+
+    @classmethod
+    def unlink_from_page(cls, page):
+        # mark the links to the page as unresolved
+        query = cls.query.filter(cls.tgt_page_id==page.id)
+        cls.__update_links(query, {cls.tgt_page_id: None})
+
+    @classmethod
+    def retitle_links_to_page(cls, page, new_title):
+        # rewrite the links to the page in every current or draft rev (in
+        # any account) to use the new title; older revs keep the old one
+        from page import Page
+        from rev import Revision
+        current_rev_ids = db_session.query(Revision.id).\
+            join(Revision.page).\
+            filter(or_(
+                Revision.rev_num==Page.curr_rev_num,
+                Revision.rev_num==Page.draft_rev_num
+            ))
+        query = cls.query.\
+            filter(cls.tgt_page_id==page.id).\
+            filter(cls.rev_id.in_(current_rev_ids))
+        cls.__update_links(query, {cls.tgt_page_title: new_title})
+
+    @classmethod
+    def __update_tgt_page_ids(cls, query, tgt_page_id):
+        cls.__update_links(query, {cls.tgt_page_id: tgt_page_id})
+
+    @classmethod
+    def __update_links(cls, query, values):
+        query.update(values, synchronize_session=False)
+        # links already in the session may hold the old values; the update
+        # flushed any changes to them first, so nothing is lost
+        keys = [column.key for column in values] + ['tgt_page']
+        for obj in db_session.identity_map.values():
+            if isinstance(obj, cls):
+                db_session.expire(obj, keys)
+
+    @classmethod
+    def make_spec(cls, rev, uid, title, alias):
+        # return the (uid, title, alias) a link is stored with; the uid is
+        # omitted for links within an account, as is an alias equal to the title
+        if not uid or uid == rev.page.acct.uid:
+            uid = None
+        if not alias or alias == title:
+            alias = None
+        return uid, title, alias
+
     @classmethod
     def new(cls, rev, link_num, uid, title, alias):
         link = cls()
         link.link_num = link_num
-        if uid and uid != rev.page.acct.uid:
-            link.tgt_page_uid = uid
-        link.tgt_page_title = title
-        if alias and alias != title:
-            link.tgt_page_alias = alias
+        link.tgt_page_uid, link.tgt_page_title, link.tgt_page_alias = \
+            cls.make_spec(rev, uid, title, alias)
         rev.links.append(link)
         db_session.add(link)
         return link
\ No newline at end of file
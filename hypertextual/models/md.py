@@ -1,7 +1,12 @@
 from __future__ import unicode_literals
-from markdown import Extension
+import re
+import threading
+from markdown import Markdown, Extension
 from markdown.inlinepatterns import Pattern
 
+# HT_LINK_RE documents the link syntax; links are extracted with split_links,
+# since the look-ahead makes the regex quadratic on long lines and lets
+# two links on the same line run together
 #    \[\[                                         (open brackets)
 #    (?:[ ]*(?P<uid>[a-zA-Z][a-zA-Z0-9]*)[ ]*::)? (uid)
 #    (?!.*::)                                     (negative look-ahead to prevent :: from matching again)
@@ -15,13 +20,87 @@ HT_LINK_RE = r'\[\[(?:[ ]*(?P<uid>[a-zA-Z][a-zA-Z0-9]*)[ ]*::)?(?!.*::)(?P<title
 #    \]\]                (close brackets)
 HT_PLACEHOLDER_RE = r'\[\[(?P<linknum>[0-9]*)\]\]'
 
+# the tokens that matter when scanning for links: brackets, the alias and uid
+# separators, and the whitespace characters that may not appear in a link
+HT_LINK_TOKEN_RE = re.compile(r'\[\[|\]\]|\||::|[\t\n\r\f\v]')
+HT_LINK_UID_RE = re.compile(r'^[ ]*([a-zA-Z][a-zA-Z0-9]*)[ ]*$')
+HT_PLACEHOLDER_TOKEN_RE = re.compile(r'\[\[([0-9]+)\]\]')
+
+def split_links(text):
+    # split text into plain text strings and (uid, title, alias) tuples,
+    # one per `[[uid::title|alias]]` link, in a single pass over the tokens;
+    # a link starts at the last `[[` before its `]]`
+    segments = []
+    pos = 0
+    start = sep = pipe = None
+    for token in HT_LINK_TOKEN_RE.finditer(text):
+        tok = token.group()
+        if tok == '[[':
+            start = token.start()
+            sep = pipe = None
+        elif start is None:
+            continue
+        elif tok == '::' and sep is None and pipe is None:
+            sep = token
+        elif tok == '|' and pipe is None:
+            pipe = token
+        elif tok == ']]':
+            link = _parse_link(text, start, sep, pipe, token)
+            if link is not None:
+                if start > pos:
+                    segments.append(text[pos:start])
+                segments.append(link)
+                pos = token.end()
+            start = None
+        else:
+            # a second separator, or whitespace other than spaces
+            start = None
+    if pos < len(text):
+        segments.append(text[pos:])
+    return segments
+
+def _parse_link(text, start, sep, pipe, close):
+    # return the stripped (uid, title, alias) of a link, or None if invalid
+    uid = alias = None
+    title_start = start + 2
+    title_end = close.start()
+    if sep is not None:
+        uid_match = HT_LINK_UID_RE.match(text[title_start:sep.start()])
+        if uid_match is None:
+            return None
+        uid = uid_match.group(1)
+        title_start = sep.end()
+    if pipe is not None:
+        alias = text[pipe.end():close.start()].strip()
+        title_end = pipe.start()
+        if not alias:
+            return None
+    title = text[title_start:title_end].strip()
+    if not title:
+        return None
+    return uid, title, alias
+
+def split_placeholders(raw_text):
+    # split raw text into plain text strings and `[[link_num]]` link nums
+    segments = []
+    pos = 0
+    for match in HT_PLACEHOLDER_TOKEN_RE.finditer(raw_text):
+        if match.start() > pos:
+            segments.append(raw_text[pos:match.start()])
+        segments.append(int(match.group(1)))
+        pos = match.end()
+    if pos < len(raw_text):
+        segments.append(raw_text[pos:])
+    return segments
+
 class HypertextualLinkExtension(Extension):
 
     def __init__(self, configs):
         # set extension defaults
         self.config = {
             'current_uid' : [None, 'Current uid.'],
-            'rev' : [None, 'Revision.']
+            'rev' : [None, 'Revision.'],
+            'targets' : [None, 'Target pages of the revision\'s links, keyed by (uid, title).']
         }
         # Override defaults with user settings
         for key, value in configs:
@@ -33,6 +112,18 @@ class HypertextualLinkExtension(Extension):
         hypertextualLinkPattern = HypertextualLinks(HT_PLACEHOLDER_RE, self.getConfigs())
         hypertextualLinkPattern.md = md
         md.inlinePatterns.add('hypertextuallink', hypertextualLinkPattern, "<not_strong")
+        self.pattern = hypertextualLinkPattern
+        md.registerExtension(self)
+
+    def set_context(self, current_uid, rev, targets):
+        # set the per-render config of an already registered extension
+        for key, value in [('current_uid', current_uid), ('rev', rev), ('targets', targets)]:
+            self.setConfig(key, value)
+            self.pattern.config[key] = value
+
+    def reset(self):
+        # called by Markdown.reset(); drop references to the last render
+        self.set_context(None, None, None)
 
 class HypertextualLinks(Pattern):
 
@@ -43,8 +134,9 @@ class HypertextualLinks(Pattern):
     def handleMatch(self, match):
         current_uid = self.config['current_uid']
         rev = self.config['rev']
+        targets = self.config['targets']
         link = rev._Revision__parse_placeholder_match(match)
-        elem = link.get_link_markdown_elem(current_uid)
+        elem = link.get_link_markdown_elem(current_uid, targets)
         return elem
 
     def _getMeta(self):
@@ -54,4 +146,19 @@ class HypertextualLinks(Pattern):
         return current_uid, rev
 
 def makeExtension(configs=None):
-    return HypertextualLinkExtension(configs=configs)
\ No newline at end of file
+    return HypertextualLinkExtension(configs=configs)
+
+# building a Markdown instance sets up its whole processor pipeline, so each
+# thread keeps one instance with the link extension registered, and reuses it
+_local = threading.local()
+
+def render_markdown(text, current_uid, rev, targets):
+    if not hasattr(_local, 'md'):
+        _local.linkExt = HypertextualLinkExtension(configs=[])
+        _local.md = Markdown(extensions=[_local.linkExt])
+    _local.linkExt.set_context(current_uid, rev, targets)
+    try:
+        html = _local.md.convert(text)
+    finally:
+        _local.md.reset()
+    return html
\ No newline at end of file
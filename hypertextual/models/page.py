@@ -1,17 +1,25 @@
 from datetime import datetime
 import re
 import translitcodec
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, UniqueConstraint, and_, or_
+from sqlalchemy.orm import relationship, validates, reconstructor, contains_eager, joinedload_all, undefer_group
 from breadcrumb import Breadcrumb
+from cache import redirect_cache
+from diff import diff_backends, auto_diff_backend
 from db import Base, db_session
 from rev import Revision
+from backlink import Backlink
+from link import Link
 from reserved import reserved_page_names
 
 class Page(Base):
 
     # table
     __tablename__ = 'page'
+    __table_args__ = (
+        UniqueConstraint('acct_id', 'slug', name='uq_page_acct_id_slug'),
+        Index('ix_page_acct_id_title', 'acct_id', 'title'),
+    )
 
     # columns
     id = Column(Integer, primary_key=True, nullable=False)
@@ -24,6 +32,9 @@ class Page(Base):
     draft_rev_num = Column(Integer)
     private = Column(Boolean)
     redirect = Column(Boolean)
+    redirect_page_id = Column(Integer, ForeignKey('page.id', ondelete='SET NULL')) # target of a redirect page
+    rev_storage = Column(String(16), nullable=False) # 'forward' or 'reverse' patches
+    render_gen = Column(Integer, nullable=False, default=0, server_default='0') # bumped when the pages this page links to change
 
     # relationships
     acct = None #-> Account.pages
@@ -35,12 +46,42 @@ class Page(Base):
         backref='page',
         primaryjoin='Page.id==Revision.page_id'
     )
+    redirect_page = relationship(
+        'Page',
+        remote_side=[id],
+        primaryjoin='Page.redirect_page_id==Page.id'
+    )
+    outlinks = relationship(
+        Backlink,
+        cascade='all,delete-orphan',
+        passive_deletes=True,
+        backref='src_page'
+    )
+
+    # storage mode for new pages (overridden from config at app startup)
+    default_rev_storage = 'forward'
 
     def __init__(self):
         self.curr_rev_num = None
         self.draft_rev_num = None
         self.private = False
         self.redirect = False
+        self.rev_storage = self.default_rev_storage
+        self.render_gen = 0
+        self.__revs_by_num = {}
+
+    @reconstructor
+    def __init_on_load(self):
+        # revs fetched individually, by rev_num
+        self.__revs_by_num = {}
+
+    @validates('private')
+    def validate_private(self, key, private):
+        # privacy affects how links to this page render for other users
+        if self.acct is not None and private != self.private:
+            self.__invalidate_renders()
+            self.__invalidate_redirects()
+        return private
 
     def user_is_owner(self, acct_or_uid):
         try:
@@ -87,15 +128,80 @@ class Page(Base):
     def get_curr_rev(self):
         rev = None
         if self.curr_rev_num is not None:
-            rev = self.revs[self.curr_rev_num]
+            rev = self.get_rev(self.curr_rev_num)
         return rev
 
     def get_draft_rev(self):
         rev = None
         if self.draft_rev_num is not None:
-            rev = self.revs[self.draft_rev_num]
+            rev = self.get_rev(self.draft_rev_num)
         return rev
 
+    def get_rev(self, rev_num):
+        if self.__revs_loaded():
+            revs = self.revs[rev_num:rev_num+1]
+            return revs[0] if revs else None
+        rev = self.__revs_by_num.get(rev_num)
+        if rev is None:
+            revs = self.get_revs(rev_num, rev_num+1)
+            if revs:
+                rev = self.__revs_by_num[rev_num] = revs[0]
+        return rev
+
+    def get_revs(self, start=0, end=None):
+        # return the revs from start up to (not including) end, with their
+        # patches, without loading the rest of the revs collection
+        if self.__revs_loaded():
+            return self.revs[start:end]
+        query = Revision.query.\
+            options(undefer_group('patch')).\
+            filter(Revision.page_id==self.id).\
+            filter(Revision.rev_num>=start)
+        if end is not None:
+            query = query.filter(Revision.rev_num<end)
+        revs = query.order_by(Revision.rev_num).all()
+        return revs
+
+    def get_full_text_rev_num(self, rev_num, backward=True):
+        # return the rev_num of the nearest rev holding full raw text,
+        # searching back from rev_num (or forward from it), or None
+        if self.__revs_loaded():
+            revs = self.revs[:rev_num+1][::-1] if backward else self.revs[rev_num:]
+            for rev in revs:
+                if rev.raw_text is not None:
+                    return rev.rev_num
+            return None
+        query = db_session.query(Revision.rev_num).\
+            filter(Revision.page_id==self.id).\
+            filter(Revision.raw_text!=None)
+        if backward:
+            query = query.\
+                filter(Revision.rev_num<=rev_num).\
+                order_by(Revision.rev_num.desc())
+        else:
+            query = query.\
+                filter(Revision.rev_num>=rev_num).\
+                order_by(Revision.rev_num)
+        row = query.first()
+        return row[0] if row else None
+
+    def get_backlinks(self):
+        # return the pages whose current published revs link to this page
+        from acct import Account
+        pages = Page.query.\
+            join(Page.outlinks).\
+            join(Page.acct).\
+            options(contains_eager(Page.acct)).\
+            filter(Backlink.tgt_page_uid==self.acct.uid).\
+            filter(Backlink.tgt_page_title==self.title).\
+            order_by(Account.uid, Page.title).all()
+        return pages
+
+    def __revs_loaded(self):
+        # a pending page, or one whose revs were already loaded,
+        # has nothing to gain from querying revs individually
+        return self.id is None or 'revs' in self.__dict__
+
     def save_draft_rev(self, text, use_markdown):
         rev = self.get_draft_rev()
         if rev is None:
@@ -108,18 +214,66 @@ class Page(Base):
         rev = Revision.new(self)
         rev.rev_num = 0 if self.curr_rev_num is None else self.curr_rev_num + 1
         self.draft_rev_num = rev.rev_num
+        self.__revs_by_num[rev.rev_num] = rev
         return rev
 
     def revert_draft_rev(self):
         rev = self.get_draft_rev()
         if rev:
             self.revs.remove(rev)
+            self.__revs_by_num.pop(self.draft_rev_num, None)
             self.draft_rev_num = None
 
     def publish_draft_rev(self):
+        prior_rev = self.get_curr_rev()
+        if prior_rev is None:
+            # links to an unpublished page only render for its owner
+            self.__invalidate_renders()
         self.curr_rev_num = self.draft_rev_num
         self.draft_rev_num = None
         self.redirect = False
+        if self.redirect_page_id is not None:
+            self.redirect_page = None
+            self.__invalidate_redirects()
+        if self.rev_storage == 'reverse' and prior_rev is not None:
+            # only the newest published rev keeps its full text
+            prior_rev.set_reverse_patch(self.get_curr_rev())
+        self.__set_outlinks()
+
+    def __set_outlinks(self):
+        # index the pages linked to by the newly published rev
+        tgt_page_keys = []
+        for link in self.get_curr_rev().links:
+            tgt_page_key = link.get_tgt_page_key()
+            if tgt_page_key not in tgt_page_keys:
+                tgt_page_keys.append(tgt_page_key)
+        self.outlinks = [Backlink.new(uid, title) for uid, title in tgt_page_keys]
+
+    def set_rev_storage(self, rev_storage, patch_format=None):
+        # patch_format, if given, also rewrites patches stored in other formats
+        if rev_storage != self.rev_storage or (patch_format is not None and any(
+            rev.patch_format not in (None, patch_format) for rev in self.revs
+        )):
+            Revision.convert_storage(self, rev_storage, patch_format)
+
+    def __invalidate_renders(self):
+        # bump the render generation of every page whose current rev links
+        # to this page, which retires their cached renders in all processes
+        src_page_ids = Backlink.get_src_page_ids(self.acct.uid, self.title)
+        if src_page_ids:
+            Page.query.\
+                filter(Page.id.in_(src_page_ids)).\
+                update({Page.render_gen: Page.render_gen + 1}, synchronize_session='fetch')
+
+    def __invalidate_redirects(self):
+        # drop cached redirects from or to this page in this process, and bump
+        # the render generation of the pages that redirect to it, which
+        # retires their cached redirects in all processes
+        if self.id is not None:
+            redirect_cache.invalidate(('page', self.id))
+            Page.query.\
+                filter(Page.redirect_page_id==self.id).\
+                update({Page.render_gen: Page.render_gen + 1}, synchronize_session='fetch')
 
     @classmethod
     def new(cls, acct, title):
@@ -128,6 +282,35 @@ class Page(Base):
         page.slug = cls.__slugify(acct, title)
         acct.pages.append(page)
         db_session.add(page)
+        page.__invalidate_renders()
+        Link.link_to_page(page)
+        return page
+
+    @classmethod
+    def get_by_slug(cls, uid, slug):
+        # load a page along with its account, and its current rev and that
+        # rev's links and their target pages, in a single query; the rev of
+        # a redirect page is not loaded, since it is not shown
+        from acct import Account
+        row = db_session.query(cls, Revision).\
+            join(cls.acct).\
+            outerjoin(Revision, and_(
+                Revision.page_id==cls.id,
+                Revision.rev_num==cls.curr_rev_num,
+                cls.redirect_page_id==None
+            )).\
+            options(
+                contains_eager(cls.acct),
+                joinedload_all(Revision.links, Link.tgt_page, cls.acct),
+                undefer_group('patch')
+            ).\
+            filter(Account.uid==uid, cls.slug==slug).\
+            first()
+        if row is None:
+            return None
+        page, rev = row
+        if rev is not None:
+            page.__revs_by_num[rev.rev_num] = rev
         return page
 
     @classmethod
@@ -155,12 +338,21 @@ class Page(Base):
         return slug_exists
 
     @classmethod
-    def move(cls, page, new_title, create_redirect=False):
+    def move(cls, page, new_title, create_redirect=False, update_links=False):
         if new_title != page.title:
             old_title = page.title
             old_slug = page.slug
+            page.__invalidate_renders()
+            page.__invalidate_redirects()
+            if update_links:
+                # rewritten links are linked to the page again by title below
+                Link.retitle_links_to_page(page, new_title)
+                Backlink.retitle(page.acct.uid, old_title, new_title)
+            Link.unlink_from_page(page)
             page.title = new_title
             page.slug = cls.__slugify(page.acct, new_title)
+            page.__invalidate_renders()
+            Link.link_to_page(page)
             if create_redirect:
                 redirected_page = cls.new(page.acct, old_title)
                 redirected_page.slug = old_slug
@@ -169,11 +361,31 @@ class Page(Base):
                 redirected_page.save_draft_rev(text, use_markdown=True)
                 redirected_page.publish_draft_rev()
                 redirected_page.redirect = True
+                # redirect straight to the final target, so that moving a
+                # page repeatedly never builds a chain of redirects
+                redirected_page.redirect_page = page.redirect_page or page
 
     @classmethod
     def delete(cls, page):
+        page.__invalidate_renders()
+        page.__invalidate_redirects()
+        Link.unlink_from_page(page)
+        cls.query.\
+            filter(cls.redirect_page_id==page.id).\
+            update({cls.redirect_page_id: None}, synchronize_session='evaluate')
         page.acct.pages.remove(page)
 
+    @classmethod
+    def get_slugs_like(cls, uid, slug):
+        # return the account's slugs that are either slug or slug-<suffix>
+        from acct import Account
+        rows = db_session.query(cls.slug).\
+            join(cls.acct).\
+            filter(Account.uid==uid).\
+            filter(or_(cls.slug==slug, cls.slug.like('%s-%%' % slug))).all()
+        slugs = set(slug for (slug,) in rows)
+        return slugs
+
     @classmethod
     def __slugify(cls, acct, title):
 
@@ -192,12 +404,25 @@ class Page(Base):
         # limit to 120 chars
         slug = slug[:120].strip('-')
 
-        # ensure uniqueness of name
+        # ensure uniqueness of name, fetching all the slugs it could clash
+        # with in one query; a concurrent request may still take the same
+        # slug, which the unique constraint on (acct_id, slug) rejects
+        taken_slugs = cls.get_slugs_like(acct.uid, slug)
         slug_to_test = slug
         i = 1
-        while slug_to_test in reserved_page_names or Page.slug_exists(acct.uid, slug_to_test):
+        while slug_to_test in reserved_page_names or slug_to_test in taken_slugs:
             slug_to_test = '%s-%s' % (slug, i)
             i+=1
         slug = slug_to_test
 
-        return slug
\ No newline at end of file
+        return slug
+
+def configure_revisions(config):
+    # apply the revision storage settings of a flask config; used by the app
+    # and by convert_revs.py, so that both write revisions the same way
+    Revision.keyframe_interval = config['KEYFRAME_INTERVAL']
+    Revision.keyframe_patch_size = config['KEYFRAME_PATCH_SIZE']
+    Page.default_rev_storage = config['REVISION_STORAGE']
+    Revision.default_patch_format = config['REVISION_PATCH_FORMAT']
+    auto_diff_backend.line_mode_threshold = config['DIFF_LINE_MODE_THRESHOLD']
+    Revision.diff_backend = diff_backends[config['DIFF_BACKEND']]
@@ -1,17 +1,29 @@
 import re
+import zlib
+import base64
+import hashlib
 from datetime import datetime
-from markdown import markdown
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Index
+from sqlalchemy.orm import relationship, deferred
 from diff_match_patch.diff_match_patch import diff_match_patch
 from db import Base, db_session
-from md import HypertextualLinkExtension, HT_LINK_RE, HT_PLACEHOLDER_RE
+from cache import render_cache
+from diff import auto_diff_backend
+from md import render_markdown, split_links, split_placeholders, HT_PLACEHOLDER_RE
 from link import Link
 
+class RevisionIntegrityError(Exception):
+    # raised when the text reconstructed from a rev's patches does not
+    # match the content hash stored when the rev was saved
+    pass
+
 class Revision(Base):
 
     # table
     __tablename__ = 'rev'
+    __table_args__ = (
+        Index('ix_rev_page_id_rev_num', 'page_id', 'rev_num', unique=True),
+    )
 
     # columns
     id = Column(Integer, primary_key=True, nullable=False)
@@ -19,8 +31,30 @@ class Revision(Base):
     create_ts = Column(DateTime, nullable=False, default=datetime.now)
 
     rev_num = Column(Integer, nullable=False)
-    patch_text = Column(Text)
+    # patches are deferred, so listing revs doesn't load them;
+    # use Page.get_revs to load a range of revs along with their patches
+    patch_text = deferred(Column(Text), group='patch')
+    raw_text = deferred(Column(Text), group='patch') # full raw text; only stored on keyframe revs
+    patch_format = Column(String(16)) # 'text', 'delta' or 'zdelta'; null when there is no patch
     use_markdown = Column(Boolean, nullable=False)
+    content_hash = Column(String(40)) # sha1 of the raw text; null for revs saved before it existed
+
+    # keyframe settings (overridden from config at app startup):
+    # a rev stores its full raw text every `keyframe_interval` revs, or once
+    # the patches replayed since the last keyframe reach `keyframe_patch_size`
+    keyframe_interval = 50
+    keyframe_patch_size = 65536
+
+    # format of new patches (overridden from config at app startup):
+    # 'text' is the patch text of diff_match_patch, with context and fuzzy
+    # matching; 'delta' is a diff_match_patch delta, which only lists the
+    # edits and must be applied to the exact text it was made from; and
+    # 'zdelta' is a zlib-compressed delta, for pages with long revisions
+    default_patch_format = 'delta'
+
+    # computes the diffs that patches are made from (overridden from config
+    # at app startup); see models/diff.py
+    diff_backend = auto_diff_backend
 
     # relationships
     page = None #-> Page.revs
@@ -33,14 +67,44 @@ class Revision(Base):
     )
 
     def render_to_html(self, current_uid):
-        if self.use_markdown:
-            html = self.__render_markdown_to_html(current_uid)
-        else:
-            html = self.__render_text_to_html(current_uid)
+        cache_key = self.__get_render_cache_key(current_uid)
+        html = render_cache.get(cache_key)
+        if html is None:
+            # resolve every link target up front, rather than once per link
+            targets = Link.resolve_targets(self.links)
+            if self.use_markdown:
+                html = self.__render_markdown_to_html(current_uid, targets)
+            else:
+                html = self.__render_text_to_html(current_uid, targets)
+            if self.id is not None:
+                render_cache.set(cache_key, html, [('rev', self.id)])
         return html
 
+    def __get_render_cache_key(self, current_uid):
+        # rendered links only vary by viewer when the viewer can create the
+        # target page (the page owner), or can see a private or unpublished
+        # target page (the target's owner); the page's render_gen changes
+        # whenever a page its current rev links to changes
+        if current_uid is None:
+            viewer = 'anonymous'
+        elif current_uid == self.page.acct.uid:
+            viewer = 'owner'
+        elif any(link.tgt_page_uid == current_uid for link in self.links):
+            viewer = ('user', current_uid)
+        else:
+            viewer = 'other'
+        return self.id, self.use_markdown, viewer, self.page.render_gen
+
     def set_text(self, text):
-        raw_text = self.__extract_links_from_text(text)
+        raw_text, link_specs = self.__extract_links_from_text(text)
+        content_hash = self.__get_content_hash(raw_text)
+        if content_hash == self.content_hash and link_specs == [link.get_spec() for link in self.links]:
+            # the text is unchanged since it was last saved
+            return
+        if self.id is not None:
+            render_cache.invalidate(('rev', self.id))
+        self.__save_links(link_specs)
+        self.content_hash = content_hash
         self.__set_patch_text_from_raw_text(raw_text)
 
     def get_text(self):
@@ -48,82 +112,223 @@ class Revision(Base):
         text = self.__inject_links_into_raw_text(raw_text)
         return text
 
-    def __render_markdown_to_html(self, current_uid):
+    def __render_markdown_to_html(self, current_uid, targets):
         raw_text = self.__get_raw_text_from_patches()
-        linkExt = HypertextualLinkExtension(configs=[
-            ('current_uid', current_uid),
-            ('rev', self)
-        ])
-        html = markdown(raw_text, extensions=[linkExt])
+        html = render_markdown(raw_text, current_uid, self, targets)
         return html
 
-    def __render_text_to_html(self, current_uid):
+    def __render_text_to_html(self, current_uid, targets):
         raw_text = self.__get_raw_text_from_patches()
         html = re.sub(
             HT_PLACEHOLDER_RE,
-            lambda match: self.__get_link_html(match, current_uid),
+            lambda match: self.__get_link_html(match, current_uid, targets),
             raw_text
         )
         html = '<pre>%s</pre>' % html
         return html
 
-    def __get_link_html(self, placeholder_match, current_uid):
+    def __get_link_html(self, placeholder_match, current_uid, targets):
         link = self.__parse_placeholder_match(placeholder_match)
-        link_html = link.get_link_html(current_uid)
+        link_html = link.get_link_html(current_uid, targets)
         return link_html
 
+    def set_reverse_patch(self, next_rev):
+        # used in reverse storage mode when a newer rev is published:
+        # replace this rev's full text with a patch from the newer rev's text
+        raw_text = self.__get_raw_text_from_patches()
+        next_raw_text = next_rev._Revision__get_raw_text_from_patches()
+        self.__set_patch(next_raw_text, raw_text)
+
     def __set_patch_text_from_raw_text(self, raw_text):
-        # diff raw text against the raw text of prior revision
-        prior_raw_text = ''
-        if self.rev_num > 0:
-            prior_rev = self.page.revs[self.rev_num-1]
-            prior_raw_text = prior_rev._Revision__get_raw_text_from_patches()
+        if self.page.rev_storage == 'reverse':
+            # the newest rev holds full text until a newer rev is published
+            self.patch_text = None
+            self.patch_format = None
+            self.raw_text = raw_text
+        else:
+            # diff raw text against the raw text of prior revision
+            prior_raw_text = ''
+            if self.rev_num > 0:
+                prior_rev = self.page.get_rev(self.rev_num-1)
+                prior_raw_text = prior_rev._Revision__get_raw_text_from_patches()
+            self.__set_patch(prior_raw_text, raw_text)
+
+    def __set_patch(self, from_raw_text, raw_text, patch_format=None):
+        patch_format = patch_format or self.default_patch_format
         dmp = diff_match_patch()
-        patches = dmp.patch_make(prior_raw_text, raw_text)
-        self.patch_text = dmp.patch_toText(patches)
+        from_raw_text = self.__to_unicode(from_raw_text)
+        diffs = self.diff_backend.diff(from_raw_text, self.__to_unicode(raw_text), patch_format == 'text')
+        if patch_format == 'text':
+            patches = dmp.patch_make(from_raw_text, diffs)
+            self.patch_text = dmp.patch_toText(patches)
+        else:
+            self.patch_text = dmp.diff_toDelta(diffs)
+            if patch_format == 'zdelta':
+                self.patch_text = base64.b64encode(zlib.compress(self.patch_text))
+        self.patch_format = patch_format
+        self.raw_text = raw_text if self.__is_keyframe() else None
+
+    @staticmethod
+    def __to_unicode(raw_text):
+        # deltas count characters, so they must be made from and applied to
+        # unicode text, whether or not the db driver returns unicode
+        if isinstance(raw_text, str):
+            raw_text = raw_text.decode('utf-8')
+        return raw_text
+
+    def __is_keyframe(self):
+        # rev 0 never needs a keyframe; forward replay starts from empty text
+        if self.rev_num == 0:
+            return False
+        if self.keyframe_interval and self.rev_num % self.keyframe_interval == 0:
+            return True
+        # sum the size of the patches between this rev and the prior keyframe
+        prior_keyframe_num = self.page.get_full_text_rev_num(self.rev_num-1)
+        start = 0 if prior_keyframe_num is None else prior_keyframe_num + 1
+        patch_size = len(self.patch_text or '')
+        for rev in self.page.get_revs(start, self.rev_num):
+            patch_size += len(rev.patch_text or '')
+        return patch_size >= self.keyframe_patch_size
 
     def __get_raw_text_from_patches(self):
-        # apply patches from rev 0 through current rev
-        # until the raw text has been reconstructed
-        dmp = diff_match_patch()
-        raw_text = ''
-        for rev in self.page.revs[0:self.rev_num+1]:
-            patches = dmp.patch_fromText(rev.patch_text)
-            raw_text = dmp.patch_apply(patches, raw_text)[0]
+        if self.raw_text is not None:
+            return self.raw_text
+        if self.page.rev_storage == 'reverse':
+            # start from the nearest full text after the current rev,
+            # then apply reverse patches back to the current rev
+            end = self.page.get_full_text_rev_num(self.rev_num, backward=False)
+            if end is None:
+                # reverse patches cannot be replayed from empty text
+                raise RevisionIntegrityError(
+                    'rev %s of page %s has no full-text rev after it' % (self.rev_num, self.page_id)
+                )
+            revs = self.page.get_revs(self.rev_num, end+1)[::-1]
+        else:
+            # start from the nearest keyframe before the current rev,
+            # then apply patches through the current rev
+            start = self.page.get_full_text_rev_num(self.rev_num) or 0
+            revs = self.page.get_revs(start, self.rev_num+1)
+        raw_text = self.__apply_patches(revs)
+        self.__check_content_hash(raw_text)
         return raw_text
 
-    def __extract_links_from_text(self, text):
-        Link.query.filter(Link.rev_id==self.id).delete()
-        raw_text = re.sub(HT_LINK_RE, self.__extract_link, text)
+    def __check_content_hash(self, raw_text):
+        if self.content_hash is not None and self.__get_content_hash(raw_text) != self.content_hash:
+            raise RevisionIntegrityError(
+                'rev %s of page %s does not match its content hash' % (self.rev_num, self.page_id)
+            )
+
+    @staticmethod
+    def __get_content_hash(raw_text):
+        if isinstance(raw_text, unicode):
+            raw_text = raw_text.encode('utf-8')
+        return hashlib.sha1(raw_text).hexdigest()
+
+    @classmethod
+    def __apply_patches(cls, revs):
+        # reconstruct raw text by starting from the first rev's full text
+        # and applying the patches of the remaining revs in order
+        raw_text = ''
+        for rev in revs:
+            raw_text = rev.__apply_patch(raw_text)
         return raw_text
 
-    def __inject_links_into_raw_text(self, raw_text):
-        text = re.sub(HT_PLACEHOLDER_RE, self.__inject_link, raw_text)
-        return text
+    def __apply_patch(self, raw_text):
+        if self.raw_text is not None:
+            return self.raw_text
+        dmp = diff_match_patch()
+        if self.patch_format in ('delta', 'zdelta'):
+            delta = self.patch_text
+            if self.patch_format == 'zdelta':
+                delta = zlib.decompress(base64.b64decode(delta))
+            try:
+                diffs = dmp.diff_fromDelta(self.__to_unicode(raw_text), delta)
+            except ValueError:
+                # the delta was not made from this text
+                raise RevisionIntegrityError(
+                    'rev %s of page %s does not apply to the text before it' % (self.rev_num, self.page_id)
+                )
+            return dmp.diff_text2(diffs)
+        patches = dmp.patch_fromText(self.patch_text)
+        return dmp.patch_apply(patches, raw_text)[0]
 
-    def __extract_link(self, link_match):
-        uid, title, alias = self.__parse_link_match(link_match)
-        link_num = len(self.links) # +1
-        link = Link.new(self, link_num, uid, title, alias)
-        placeholder_text = link.get_placeholder_text()
-        return placeholder_text
+    @classmethod
+    def convert_storage(cls, page, rev_storage, patch_format=None):
+        # rewrite the patch chain of a page for the given storage mode and
+        # patch format, reconstructing the raw text of each rev only once;
+        # with no patch format, each patch keeps its format, and a rev that
+        # had no patch takes the format of the page's other patches
+        revs = page.get_revs()
+        patch_formats = [rev.patch_format for rev in revs if rev.patch_format is not None]
+        page_patch_format = patch_formats[0] if patch_formats else None
+        raw_texts = []
+        raw_text = ''
+        if page.rev_storage == 'reverse':
+            for rev in reversed(revs):
+                raw_text = rev.__apply_patch(raw_text)
+                rev.__check_content_hash(raw_text)
+                raw_texts.insert(0, raw_text)
+        else:
+            for rev in revs:
+                raw_text = rev.__apply_patch(raw_text)
+                rev.__check_content_hash(raw_text)
+                raw_texts.append(raw_text)
+        page.rev_storage = rev_storage
+        for rev, raw_text in zip(revs, raw_texts):
+            rev_patch_format = patch_format or rev.patch_format or page_patch_format
+            if rev_storage == 'forward':
+                prior_raw_text = raw_texts[rev.rev_num-1] if rev.rev_num > 0 else ''
+                rev.__set_patch(prior_raw_text, raw_text, rev_patch_format)
+            elif page.curr_rev_num is None or rev.rev_num >= page.curr_rev_num:
+                rev.patch_text = None
+                rev.patch_format = None
+                rev.raw_text = raw_text
+            else:
+                rev.__set_patch(raw_texts[rev.rev_num+1], raw_text, rev_patch_format)
 
-    def __inject_link(self, placeholder_match):
-        link = self.__parse_placeholder_match(placeholder_match)
-        link_text = link.get_link_text()
-        return link_text
-
-    def __parse_link_match(self, link_match):
-        elems = link_match.groupdict()
-        uid = elems['uid']
-        title = elems['title']
-        alias = elems['alias']
-        if uid:
-            uid = uid.strip()
-        title = title.strip()
-        if alias:
-            alias = alias.strip()
-        return uid, title, alias
+    def __extract_links_from_text(self, text):
+        raw_text = []
+        link_specs = []
+        for segment in split_links(text):
+            if isinstance(segment, tuple):
+                link_num = len(link_specs)
+                link_specs.append(Link.make_spec(self, *segment))
+                segment = '[[%s]]' % link_num
+            raw_text.append(segment)
+        return ''.join(raw_text), link_specs
+
+    def __save_links(self, link_specs):
+        # compare the new links with the stored ones by link_num, and write
+        # only the differences, as bulk statements
+        stale_links = [
+            link for link in self.links
+            if link_specs[link.link_num:link.link_num+1] != [link.get_spec()]
+        ]
+        stored_specs = dict((link.link_num, link.get_spec()) for link in self.links)
+        new_specs = dict(
+            (link_num, spec) for link_num, spec in enumerate(link_specs)
+            if stored_specs.get(link_num) != spec
+        )
+        if not stale_links and not new_specs:
+            return
+        if self.id is None:
+            db_session.flush() # assigns the rev an id
+        if stale_links:
+            Link.delete_links(self, [link.link_num for link in stale_links])
+            for link in stale_links:
+                if link in db_session:
+                    db_session.expunge(link)
+        if new_specs:
+            Link.insert_links(self, new_specs)
+        db_session.expire(self, ['links'])
+
+    def __inject_links_into_raw_text(self, raw_text):
+        text = []
+        for segment in split_placeholders(raw_text):
+            if isinstance(segment, int):
+                segment = self.links[segment].get_link_text()
+            text.append(segment)
+        return ''.join(text)
 
     def __parse_placeholder_match(self, placeholder_match):
         elems = placeholder_match.groupdict()
@@ -134,6 +339,6 @@ class Revision(Base):
     @classmethod
     def new(cls, page):
         rev = cls()
-        page.revs.append(rev)
+        rev.page = page # appends to page.revs without loading it
         db_session.add(rev)
         return rev
\ No newline at end of file
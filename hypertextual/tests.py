@@ -1,8 +1,9 @@
-import unittest, re
+import unittest, re, hashlib
 from sqlalchemy import create_engine
 from config import CONN_STR_TEST
-from models import db_session, Base, Account, Page, Revision, Link
-from models.md import HT_LINK_RE, HT_PLACEHOLDER_RE
+from models import db_session, render_cache, acct_cache, redirect_cache, Base, Account, Page, Revision, Link
+from models import RevisionIntegrityError, DiffBackend, diff_backends, auto_diff_backend
+from models.md import HT_LINK_RE, HT_PLACEHOLDER_RE, split_links, split_placeholders
 
 class AlchemyTestBase(unittest.TestCase):
 
@@ -20,6 +21,9 @@ class AlchemyTestBase(unittest.TestCase):
 
     def tearDown(self):
         db_session.rollback()
+        render_cache.clear()
+        acct_cache.clear()
+        redirect_cache.clear()
 
 class TestAccount(AlchemyTestBase):
 
@@ -32,6 +36,24 @@ class TestAccount(AlchemyTestBase):
         self.assertEqual('scott', acct.uid)
         self.assertIs(acct, self.acct)
 
+    def test_get_by_id(self):
+        db_session.flush()
+        self.assertEqual(2, len(self.acct.pages)) # loaded, but not cached
+        acct = Account.get_by_id(self.acct.id)
+        self.assertIs(acct, self.acct)
+        cached_acct = acct_cache.get(self.acct.id)
+        self.assertIsNot(cached_acct, self.acct)
+        self.assertEqual('scott', cached_acct.uid)
+        self.assertNotIn('pages', cached_acct.__dict__)
+        # a later session gets the cached account merged in
+        db_session.expunge_all()
+        acct = Account.get_by_id(self.acct.id)
+        self.assertIsNot(acct, cached_acct)
+        self.assertIn(acct, db_session)
+        self.assertEqual('scott', acct.uid)
+        self.assertEqual(2, len(acct.pages))
+        self.assertIsNone(Account.get_by_id(-1))
+
     def test_get_all(self):
         Account.new('sally', 'secret', 'sally@gmail.com')
         all_accts = Account.get_all()
@@ -109,6 +131,12 @@ class TestPage(AlchemyTestBase):
         self.assertEqual('Action', page.title)
         self.assertEqual('action-1', page.slug)
 
+    def test_new_duplicate_slug(self):
+        slugs = [Page.new(self.acct, title).slug for title in ['Book-List', 'Book List!', 'Book List Two']]
+        self.assertEqual(['book-list-1', 'book-list-2', 'book-list-two'], slugs)
+        self.assertEqual(set(['book-list', 'book-list-1', 'book-list-2', 'book-list-two']),
+            Page.get_slugs_like('scott', 'book-list'))
+
     def test_title_exists(self):
         book_list_exists = Page.title_exists(self.acct.uid, 'Book List')
         self.assertTrue(book_list_exists)
@@ -243,6 +271,42 @@ class TestPage(AlchemyTestBase):
         self.assertIsNotNone(self.page.curr_rev_num)
         self.assertEqual(2, len(self.page.revs))
 
+    def test_get_revs(self):
+        self.addCleanup(setattr, Revision, 'keyframe_interval', Revision.keyframe_interval)
+        Revision.keyframe_interval = 3
+        texts = ['book list %s' % i for i in range(7)]
+        for text in texts:
+            self.page.save_draft_rev(text, True)
+            self.page.publish_draft_rev()
+        db_session.flush()
+        db_session.expire_all()
+        # revs are fetched by rev_num, without loading the revs collection
+        rev = self.page.get_rev(5)
+        self.assertEqual(5, rev.rev_num)
+        self.assertEqual([2, 3, 4], [r.rev_num for r in self.page.get_revs(2, 5)])
+        self.assertEqual(3, self.page.get_full_text_rev_num(5))
+        self.assertEqual(6, self.page.get_full_text_rev_num(4, backward=False))
+        self.assertEqual('book list 5', rev.get_text())
+        self.assertEqual('book list 6', self.page.get_curr_rev().get_text())
+        self.assertNotIn('revs', self.page.__dict__)
+
+    def test_get_by_slug(self):
+        self.page.save_draft_rev('book list sample text [[Home]]', True)
+        self.page.publish_draft_rev()
+        db_session.flush()
+        db_session.expunge_all()
+        page = Page.get_by_slug('scott', 'book-list')
+        self.assertEqual('Book List', page.title)
+        # account, current rev and its links are loaded with the page
+        self.assertIn('acct', page.__dict__)
+        rev = page._Page__revs_by_num[0]
+        self.assertIn('links', rev.__dict__)
+        self.assertIn('patch_text', rev.__dict__)
+        self.assertIs(rev, page.get_curr_rev())
+        self.assertEqual('book list sample text [[Home]]', rev.get_text())
+        self.assertIsNone(Page.get_by_slug('scott', 'movie-list'))
+        self.assertIsNone(Page.get_by_slug('sally', 'book-list'))
+
     def test_move_with_redirect(self):
         self.page.save_draft_rev('book list sample text', True)
         self.page.publish_draft_rev()
@@ -259,6 +323,59 @@ class TestPage(AlchemyTestBase):
         self.assertEqual('reading-list', moved_page.slug)
         moved_text = moved_page.get_curr_rev().get_text()
         self.assertEqual('book list sample text', moved_text)
+        self.assertIs(moved_page, redirect_page.redirect_page)
+        # changes to the target bump the redirect page's render generation,
+        # which retires cached redirects to it in every process
+        db_session.flush()
+        render_gen = redirect_page.render_gen
+        moved_page.private = True
+        self.assertGreater(redirect_page.render_gen, render_gen)
+        render_gen = redirect_page.render_gen
+        Page.move(moved_page, 'Library')
+        self.assertGreater(redirect_page.render_gen, render_gen)
+
+    def test_move_with_redirect_chain(self):
+        self.page.save_draft_rev('book list sample text', True)
+        self.page.publish_draft_rev()
+        Page.move(self.page, 'Reading List', True)
+        Page.move(self.page, 'Library', True)
+        first_redirect_page = self.acct.get_page_by_title('Book List')
+        second_redirect_page = self.acct.get_page_by_title('Reading List')
+        self.assertIs(self.page, first_redirect_page.redirect_page)
+        self.assertIs(self.page, second_redirect_page.redirect_page)
+        # moving a redirect page redirects to its target, not to itself
+        Page.move(second_redirect_page, 'Reading List (old)', True)
+        third_redirect_page = self.acct.get_page_by_title('Reading List')
+        self.assertIs(self.page, third_redirect_page.redirect_page)
+        # publishing over a redirect page, or deleting its target, ends the redirect
+        first_redirect_page.save_draft_rev('book list is back', True)
+        first_redirect_page.publish_draft_rev()
+        self.assertIsNone(first_redirect_page.redirect_page)
+        Page.delete(self.page)
+        self.assertIsNone(third_redirect_page.redirect_page_id)
+
+    def test_move_with_update_links(self):
+        self.page.save_draft_rev('book list sample text', True)
+        self.page.publish_draft_rev()
+        home_page = self.acct.get_page_by_title('Home')
+        home_page.save_draft_rev('[[Book List]] and [[Book List|my books]]', True)
+        home_page.publish_draft_rev()
+        sally = Account.new('sally', 'secret', 'sally@gmail.com')
+        sally_page = Page.new(sally, 'Dear Diary')
+        old_rev = sally_page.save_draft_rev('see [[scott::Book List]]', True)
+        sally_page.publish_draft_rev()
+        sally_page.save_draft_rev('see [[scott::Book List]] again', True)
+        sally_page.publish_draft_rev()
+        Page.move(self.page, 'Reading List', update_links=True)
+        home_text = home_page.get_curr_rev().get_text()
+        self.assertEqual('[[Reading List]] and [[Reading List|my books]]', home_text)
+        sally_text = sally_page.get_curr_rev().get_text()
+        self.assertEqual('see [[scott::Reading List]] again', sally_text)
+        # older revs keep the old title, and no longer resolve to the page
+        self.assertEqual('see [[scott::Book List]]', old_rev.get_text())
+        self.assertIsNone(old_rev.links[0].tgt_page)
+        self.assertIs(self.page, sally_page.get_curr_rev().links[0].tgt_page)
+        self.assertEqual([sally_page, home_page], self.page.get_backlinks())
 
     def test_delete(self):
         Page.delete(self.page)
@@ -266,6 +383,33 @@ class TestPage(AlchemyTestBase):
         self.assertIsNone(page)
         self.assertEqual(2, len(self.acct.pages))
 
+    def test_backlinks(self):
+        self.page.save_draft_rev('[[Home]] [[Home|home page]] [[Record Collection]]', True)
+        self.assertEqual([], self.page.outlinks)
+        self.page.publish_draft_rev()
+        tgt_page_keys = [(b.tgt_page_uid, b.tgt_page_title) for b in self.page.outlinks]
+        self.assertEqual([('scott', 'Home'), ('scott', 'Record Collection')], tgt_page_keys)
+        home_page = self.acct.get_page_by_title('Home')
+        self.assertEqual([self.page], home_page.get_backlinks())
+        # only the current published rev counts
+        self.page.save_draft_rev('[[Record Collection]]', True)
+        self.assertEqual([self.page], home_page.get_backlinks())
+        self.page.publish_draft_rev()
+        self.assertEqual([], home_page.get_backlinks())
+        # creating, moving and deleting a linked page bump the render generation
+        render_gen = self.page.render_gen
+        page = Page.new(self.acct, 'Record Collection')
+        self.assertEqual(render_gen + 1, self.page.render_gen)
+        Page.move(page, 'Records')
+        self.assertEqual(render_gen + 2, self.page.render_gen)
+        # deleting the moved page does not, since nothing links to its new title
+        Page.delete(page)
+        self.assertEqual(render_gen + 2, self.page.render_gen)
+        page = Page.new(self.acct, 'Record Collection')
+        self.assertEqual(render_gen + 3, self.page.render_gen)
+        Page.delete(page)
+        self.assertEqual(render_gen + 4, self.page.render_gen)
+
 class TestRevision(AlchemyTestBase):
 
     def setUp(self):
@@ -288,6 +432,144 @@ class TestRevision(AlchemyTestBase):
         text = rev.get_text()
         self.assertEqual('book list revised text', text)
 
+    def test_keyframes(self):
+        self.addCleanup(setattr, Revision, 'keyframe_interval', Revision.keyframe_interval)
+        Revision.keyframe_interval = 2
+        texts = ['book list %s' % i for i in range(5)]
+        for text in texts:
+            self.page.save_draft_rev(text, True)
+            self.page.publish_draft_rev()
+        keyframes = [rev.rev_num for rev in self.page.revs if rev.raw_text is not None]
+        self.assertEqual([2, 4], keyframes)
+        for rev, text in zip(self.page.revs, texts):
+            self.assertEqual(text, rev.get_text())
+
+    def test_keyframe_patch_size(self):
+        self.addCleanup(setattr, Revision, 'keyframe_patch_size', Revision.keyframe_patch_size)
+        Revision.keyframe_patch_size = 200
+        self.page.save_draft_rev('a' * 100, True)
+        self.page.publish_draft_rev()
+        rev = self.page.save_draft_rev('b' * 100, True)
+        self.assertEqual('b' * 100, rev.raw_text)
+        self.assertEqual('b' * 100, rev.get_text())
+
+    def test_reverse_storage(self):
+        self.page.rev_storage = 'reverse'
+        texts = ['book list %s' % i for i in range(3)]
+        for text in texts:
+            self.page.save_draft_rev(text, True)
+            self.page.publish_draft_rev()
+        draft_rev = self.page.save_draft_rev('book list draft', True)
+        curr_rev = self.page.get_curr_rev()
+        self.assertEqual('book list draft', draft_rev.raw_text)
+        self.assertEqual('book list 2', curr_rev.raw_text)
+        self.assertIsNone(curr_rev.patch_text)
+        for rev, text in zip(self.page.revs, texts):
+            self.assertEqual(text, rev.get_text())
+        self.page.publish_draft_rev()
+        self.assertIsNone(curr_rev.raw_text)
+        self.assertEqual('book list 2', curr_rev.get_text())
+        self.assertEqual('book list draft', self.page.get_curr_rev().get_text())
+        # a chain with no full text to start from is reported, not replayed
+        self.page.get_curr_rev().raw_text = None
+        self.assertRaises(RevisionIntegrityError, curr_rev.get_text)
+
+    def test_convert_storage(self):
+        texts = ['book list %s' % i for i in range(4)]
+        for text in texts:
+            self.page.save_draft_rev(text, True)
+            self.page.publish_draft_rev()
+        self.page.save_draft_rev('book list draft', True)
+        texts.append('book list draft')
+        self.page.set_rev_storage('reverse')
+        self.assertEqual('reverse', self.page.rev_storage)
+        self.assertEqual(['book list 3', 'book list draft'], [rev.raw_text for rev in self.page.revs[3:]])
+        self.assertEqual(texts, [rev.get_text() for rev in self.page.revs])
+        self.page.set_rev_storage('forward')
+        self.assertEqual('forward', self.page.rev_storage)
+        self.assertEqual(texts, [rev.get_text() for rev in self.page.revs])
+
+    def test_patch_formats(self):
+        self.addCleanup(setattr, Revision, 'default_patch_format', Revision.default_patch_format)
+        texts = ['book list %s' % i for i in range(3)] + [u'book list \u00e9']
+        for patch_format in ['text', 'delta', 'zdelta']:
+            Revision.default_patch_format = patch_format
+            self.page.save_draft_rev(texts[len(self.page.revs)], True)
+            self.page.publish_draft_rev()
+            self.assertEqual(patch_format, self.page.get_curr_rev().patch_format)
+        Revision.default_patch_format = 'delta'
+        self.page.save_draft_rev(texts[3], True)
+        self.assertEqual(['text', 'delta', 'zdelta', 'delta'], [rev.patch_format for rev in self.page.revs])
+        self.assertEqual(texts, [rev.get_text() for rev in self.page.revs])
+        self.page.set_rev_storage('forward', 'zdelta')
+        self.assertEqual(['zdelta'] * 4, [rev.patch_format for rev in self.page.revs])
+        self.assertEqual(texts, [rev.get_text() for rev in self.page.revs])
+        self.page.set_rev_storage('reverse', 'text')
+        self.assertEqual(['text', 'text', None, None], [rev.patch_format for rev in self.page.revs])
+        self.assertEqual(texts, [rev.get_text() for rev in self.page.revs])
+        # converting only the storage mode keeps the patch format
+        self.page.set_rev_storage('forward')
+        self.assertEqual(['text'] * 4, [rev.patch_format for rev in self.page.revs])
+        self.assertEqual(texts, [rev.get_text() for rev in self.page.revs])
+
+    def test_diff_backends(self):
+        self.addCleanup(setattr, Revision, 'diff_backend', Revision.diff_backend)
+        texts = ['book list\n%s\n' % i for i in range(3)]
+        for name, text in zip(['char', 'line', 'auto'], texts):
+            Revision.diff_backend = diff_backends[name]
+            self.page.save_draft_rev(text, True)
+            self.page.publish_draft_rev()
+        self.assertEqual(texts, [rev.get_text() for rev in self.page.revs])
+
+    def test_line_diff_patches(self):
+        self.addCleanup(setattr, Revision, 'diff_backend', Revision.diff_backend)
+        self.addCleanup(setattr, Revision, 'default_patch_format', Revision.default_patch_format)
+        Revision.diff_backend = diff_backends['line']
+        paras = ['book %d\n' % i for i in range(2000)]
+        texts = ['\n'.join(paras)]
+        for patch_format in ['text', 'delta', 'zdelta']:
+            Revision.default_patch_format = patch_format
+            paras[len(texts) * 500] = 'record %d\n' % len(texts)
+            texts.append('\n'.join(paras))
+            self.page.save_draft_rev(texts[-2], True)
+            self.page.publish_draft_rev()
+        self.page.save_draft_rev(texts[-1], True)
+        self.assertEqual(texts, [rev.get_text() for rev in self.page.revs])
+        # the line hunks are patched as they are, a few lines at a time
+        self.assertLess(len(self.page.revs[2].patch_text), 100)
+
+    def test_render_cache(self):
+        rev = self.page.save_draft_rev('[[Record Collection]]', False)
+        self.page.publish_draft_rev()
+        db_session.flush()
+        html = rev.render_to_html(None)
+        self.assertEqual('<pre><a href="#" class="link-does-not-exist">Record Collection</a></pre>', html)
+        self.assertEqual(html, render_cache.get((rev.id, False, 'anonymous', 0)))
+        # creating the target page bumps the page's render generation,
+        # which retires the cached render
+        page = Page.new(self.acct, 'Record Collection')
+        page.save_draft_rev('record collection sample text', True)
+        page.publish_draft_rev()
+        self.assertEqual(2, self.page.render_gen)
+        html = rev.render_to_html(None)
+        self.assertEqual('<pre><a href="/scott/record-collection">Record Collection</a></pre>', html)
+        # so does making it private
+        page.private = True
+        html = rev.render_to_html(None)
+        self.assertEqual('<pre><a href="#" class="link-does-not-exist">Record Collection</a></pre>', html)
+        html = rev.render_to_html(self.acct.uid)
+        self.assertEqual('<pre><a href="/scott/record-collection">Record Collection</a></pre>', html)
+
+    def test_render_markdown_reuse(self):
+        # the per-thread markdown instance must not leak state between renders
+        rev = self.page.save_draft_rev('[books][bk] [[Home]]\n\n[bk]: /books', True)
+        html = rev.render_to_html(self.acct.uid)
+        self.assertEqual('<p><a href="/books">books</a> <a href="/scott">Home</a></p>', html)
+        page = Page.new(self.acct, 'Movie List')
+        rev = page.save_draft_rev('[movies][bk] [[Home|Scott Home]]', True)
+        html = rev.render_to_html(self.acct.uid)
+        self.assertEqual('<p>[movies][bk] <a href="/scott">Scott Home</a></p>', html)
+
     def test_link_to_self(self):
         rev = self.page.save_draft_rev('book list sample text [[Home]]', True)
         raw_text = rev._Revision__get_raw_text_from_patches()
@@ -338,6 +620,49 @@ class TestRevision(AlchemyTestBase):
         html = rev.render_to_html(self.acct.uid)
         self.assertEqual('<pre>book list sample text <a href="/sally">Sally Home</a></pre>', html)
 
+    def test_save_links(self):
+        rev = self.page.save_draft_rev('[[Home]] [[Record Collection|records]] [[sally::Diary]]', True)
+        home_link, record_link, diary_link = rev.links
+        self.assertEqual((None, 'Record Collection', 'records'), record_link.get_spec())
+        self.assertEqual(('sally', 'Diary', None), diary_link.get_spec())
+        # unchanged links are kept, changed ones replaced, and extra ones dropped
+        rev = self.page.save_draft_rev('[[Home]] [[Record Collection]]', True)
+        self.assertEqual(2, len(rev.links))
+        self.assertIs(home_link, rev.links[0])
+        self.assertIsNot(record_link, rev.links[1])
+        self.assertEqual((None, 'Record Collection', None), rev.links[1].get_spec())
+        self.assertEqual(2, Link.query.filter(Link.rev_id==rev.id).count())
+        self.assertEqual('[[Home]] [[Record Collection]]', rev.get_text())
+
+    def test_content_hash(self):
+        rev = self.page.save_draft_rev('book list [[Home]]', True)
+        self.assertEqual(hashlib.sha1('book list [[0]]').hexdigest(), rev.content_hash)
+        # saving the same text again changes nothing
+        db_session.flush()
+        patch_text = rev.patch_text
+        link = rev.links[0]
+        rev = self.page.save_draft_rev('book list [[Home]]', True)
+        self.assertIs(patch_text, rev.patch_text)
+        self.assertIs(link, rev.links[0])
+        self.assertFalse(db_session.is_modified(rev))
+        # but a changed link is saved
+        rev = self.page.save_draft_rev('book list [[Home|home]]', True)
+        self.assertEqual('book list [[Home|home]]', rev.get_text())
+
+    def test_integrity_check(self):
+        self.page.save_draft_rev('book list sample text', True)
+        self.page.publish_draft_rev()
+        rev = self.page.save_draft_rev('book list sample text, revised', True)
+        rev.patch_text = '@@ -1,5 +1,5 @@\n-book \n+look \n'
+        self.assertRaises(RevisionIntegrityError, rev.get_text)
+
+    def test_adjacent_links(self):
+        rev = self.page.save_draft_rev('[[Home]] [[Private Home|private]] std::vector', True)
+        raw_text = rev._Revision__get_raw_text_from_patches()
+        self.assertEqual('[[0]] [[1]] std::vector', raw_text)
+        text = rev.get_text()
+        self.assertEqual('[[Home]] [[Private Home|private]] std::vector', text)
+
     def test_link_with_markdown(self):
         rev = self.page.save_draft_rev('book list sample text **[[Home]]**', True)
         raw_text = rev._Revision__get_raw_text_from_patches()
@@ -495,6 +820,39 @@ class TestLink(AlchemyTestBase):
         self.assertEqual('#', md_elem.get('href'))
         self.assertEqual('link-does-not-exist', md_elem.get('class'))
 
+    def test_resolve_targets(self):
+        rev = self.sally_rev
+        links = [
+            Link.new(rev, 0, 'scott', 'Book List', None),
+            Link.new(rev, 1, None, 'Dear Diary', None),
+            Link.new(rev, 2, None, 'Record Collection', None),
+        ]
+        targets = Link.resolve_targets(links)
+        self.assertEqual(2, len(targets))
+        self.assertIs(self.scott_page, targets[('scott', 'Book List')])
+        self.assertIs(self.sally_page, targets[('sally', 'Dear Diary')])
+        link_html = links[0].get_link_html('sally', targets)
+        self.assertEqual('<a href="/scott/book-list">Book List</a>', link_html)
+        link_html = links[2].get_link_html('sally', targets)
+        self.assertEqual('<a href="/sally/action/create?title=Record Collection" class="link-create">Record Collection</a>', link_html)
+
+    def test_tgt_page(self):
+        rev = self.sally_page.save_draft_rev('[[scott::Book List]] [[Record Collection]]', True)
+        book_link, record_link = rev.links
+        self.assertIs(self.scott_page, book_link.tgt_page)
+        self.assertIsNone(record_link.tgt_page)
+        # links follow their target pages as they are created, moved and deleted
+        record_page = Page.new(self.sally, 'Record Collection')
+        self.assertEqual(record_page.id, record_link.tgt_page_id)
+        self.assertIs(record_page, record_link.tgt_page)
+        Page.move(record_page, 'Records', create_redirect=True)
+        redirect_page = self.sally.get_page_by_title('Record Collection')
+        self.assertIs(redirect_page, record_link.tgt_page)
+        Page.delete(redirect_page)
+        self.assertIsNone(record_link.tgt_page_id)
+        Page.delete(self.scott_page)
+        self.assertIsNone(book_link.tgt_page)
+
 class TestRegex(unittest.TestCase):
 
     def test_regex(self):
@@ -554,5 +912,68 @@ class TestRegex(unittest.TestCase):
         self.assertIsNone(gg)
         self.assertIsNone(hh)
 
+class TestTokenizer(unittest.TestCase):
+
+    def test_split_links(self):
+        self.assertEqual([(None, 'Hello World', None)], split_links('[[Hello World]]'))
+        self.assertEqual([(None, 'Home', 'Home page')], split_links('[[Home|Home page]]'))
+        self.assertEqual([('nw', 'Home', None)], split_links('[[ nw::Home]]'))
+        self.assertEqual([('nw9', 'Home', 'Home page')], split_links('[[nw9 ::Home|Home page]]'))
+        self.assertEqual(['[[nw|Home|Home page]]'], split_links('[[nw|Home|Home page]]'))
+        self.assertEqual(['[[nw|Home::Home page]]'], split_links('[[nw|Home::Home page]]'))
+        self.assertEqual(['[[nw::Home::Home page]]'], split_links('[[nw::Home::Home page]]'))
+        self.assertEqual([('nw', 'Home:Home page', None)], split_links('[[nw::Home:Home page]]'))
+        self.assertEqual(['[[9nw ::Home|Home page]]'], split_links('[[9nw ::Home|Home page]]'))
+        self.assertEqual(['[[Home\tpage]]'], split_links('[[Home\tpage]]'))
+
+    def test_split_adjacent_links(self):
+        segments = split_links('see [[Home]][[nw::Books|books]] and [[Movies]].')
+        self.assertEqual([
+            'see ',
+            (None, 'Home', None),
+            ('nw', 'Books', 'books'),
+            ' and ',
+            (None, 'Movies', None),
+            '.',
+        ], segments)
+
+    def test_split_links_unclosed(self):
+        segments = split_links('[[a [[b::c]] std::vector [[d')
+        self.assertEqual(['[[a ', ('b', 'c', None), ' std::vector [[d'], segments)
+
+    def test_split_placeholders(self):
+        segments = split_placeholders('a [[0]][[12]] [[]] [[c3]]')
+        self.assertEqual(['a ', 0, 12, ' [[]] [[c3]]'], segments)
+
+class TestDiffBackend(unittest.TestCase):
+
+    def test_line_diff(self):
+        diffs = diff_backends['line'].diff('a\nb\nc', 'a\nB\nc\nd')
+        self.assertEqual([(0, 'a\n'), (-1, 'b'), (1, 'B'), (0, '\nc'), (1, '\nd')], diffs)
+        self.assertEqual([], diff_backends['line'].diff('', ''))
+
+    def test_line_diff_repeated_lines(self):
+        # a large page whose paragraphs are separated by identical blank lines
+        paras = ['paragraph %d\n' % i for i in range(20000)]
+        text1 = '\n'.join(paras)
+        paras[100] = 'first change\n'
+        paras[19900] = 'second change\n'
+        text2 = '\n'.join(paras)
+        diffs = diff_backends['line'].diff(text1, text2)
+        self.assertEqual(text1, ''.join(text for op, text in diffs if op <= 0))
+        self.assertEqual(text2, ''.join(text for op, text in diffs if op >= 0))
+        self.assertLess(sum(len(text) for op, text in diffs if op != 0), 60)
+
+    def test_auto_diff(self):
+        self.addCleanup(setattr, auto_diff_backend, 'line_mode_threshold', auto_diff_backend.line_mode_threshold)
+        self.addCleanup(setattr, auto_diff_backend, 'line_backend', auto_diff_backend.line_backend)
+        class MarkerDiffBackend(DiffBackend):
+            def diff(self, text1, text2, semantic=False):
+                return [(0, 'line')]
+        auto_diff_backend.line_mode_threshold = 10
+        auto_diff_backend.line_backend = MarkerDiffBackend()
+        self.assertEqual([(0, 'book'), (1, 's')], auto_diff_backend.diff('book', 'books'))
+        self.assertEqual([(0, 'line')], auto_diff_backend.diff('book list', 'books list'))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file